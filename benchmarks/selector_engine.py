@@ -0,0 +1,67 @@
+"""Compare the legacy generated selector-check script with the persistent
+in-page selector engine.
+
+Needs a browser, configured the same way as the server (SELENIUM_MODE,
+SELENIUM_HUB_URL, ...):
+
+    python -m benchmarks.selector_engine [repeats]
+"""
+import os
+import sys
+import time
+from src import selector_engine
+from src.browser_actions import BrowserActions
+from src.browser_manager import browser_manager
+
+SIZES = (100, 1000, 10000)
+TEST_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_pages', 'test.html')
+
+POPULATE_JS = '''
+const root = document.createElement('div');
+for (let i = 0; i < arguments[0]; i += 2) {
+    const el = document.createElement('span');
+    el.id = 'bench-' + i;
+    el.textContent = i;
+    root.appendChild(el);
+}
+document.body.appendChild(root);
+'''
+
+
+def timed(fn, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main(repeats=5):
+    session_id = browser_manager.create_session()
+    driver = browser_manager.get_session(session_id)
+    actions = BrowserActions(driver)
+    try:
+        print(f'{"selectors":>9} {"legacy ms":>10} {"engine ms":>10} {"legacy KiB":>11} {"engine KiB":>11}')
+        for size in SIZES:
+            driver.get('file://' + os.path.abspath(TEST_PAGE))
+            driver.execute_script(POPULATE_JS, size)
+            xpaths = [f"//*[@id='bench-{i}']" for i in range(size)]
+
+            def legacy():
+                driver.execute_script(BrowserActions._generate_selector_check_js(xpaths))
+
+            # First call installs the engine, only steady state calls are measured
+            actions.check_selectors(xpaths)
+            legacy_ms = timed(legacy, repeats)
+            engine_ms = timed(lambda: actions.check_selectors(xpaths), repeats)
+            legacy_kib = len(BrowserActions._generate_selector_check_js(xpaths)) / 1024
+            engine_kib = (len(selector_engine.CALL_JS) + sum(len(x) + 3 for x in xpaths)) / 1024
+            print(f'{size:>9} {legacy_ms:>10.1f} {engine_ms:>10.1f} {legacy_kib:>11.1f} {engine_kib:>11.1f}')
+    finally:
+        browser_manager.close_session(session_id)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
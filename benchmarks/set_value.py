@@ -0,0 +1,51 @@
+"""Compare the keystroke and direct set-value modes by payload size.
+
+Needs a browser, configured the same way as the server (SELENIUM_MODE,
+SELENIUM_HUB_URL, ...):
+
+    python -m benchmarks.set_value [repeats]
+"""
+import json
+import os
+import sys
+from selenium.webdriver.common.by import By
+from src.browser_actions import BrowserActions
+from src.browser_manager import browser_manager
+from benchmarks.selector_engine import timed
+
+SIZES = (10, 100, 1000, 10000)
+TEST_PAGE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_pages', 'test.html')
+
+ADD_TEXTAREA_JS = '''
+const el = document.createElement('textarea');
+el.id = 'bench-input';
+document.body.appendChild(el);
+'''
+
+
+def payload(size):
+    # JSON blob of roughly size characters
+    return json.dumps({'data': 'x' * max(size - 12, 0)})[:size]
+
+
+def main(repeats=3):
+    session_id = browser_manager.create_session()
+    driver = browser_manager.get_session(session_id)
+    actions = BrowserActions(driver)
+    try:
+        driver.get('file://' + os.path.abspath(TEST_PAGE))
+        driver.execute_script(ADD_TEXTAREA_JS)
+        element = driver.find_element(By.ID, 'bench-input')
+        print(f'{"chars":>7} {"keys ms":>10} {"direct ms":>10}')
+        for size in SIZES:
+            value = payload(size)
+            keys_ms = timed(lambda: actions._type_value(element, value), repeats)
+            direct_ms = timed(lambda: actions._assign_value(element, value), repeats)
+            assert element.get_attribute('value') == value
+            print(f'{size:>7} {keys_ms:>10.1f} {direct_ms:>10.1f}')
+    finally:
+        browser_manager.close_session(session_id)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,59 @@
+"""Measure the shared ancestor visibility memo of the selector engine on the
+synthetic tests/test_pages/visibility.html form.
+
+Both variants run inside the page so only the visibility checks are timed:
+check() evaluates all selectors in one pass sharing the ancestor verdicts,
+checkOne() per selector starts from scratch every time.
+
+    python -m benchmarks.visibility [repeats]
+"""
+import os
+import sys
+from src import selector_engine
+from src.browser_manager import browser_manager
+
+FIXTURE = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_pages', 'visibility.html')
+SHAPES = ((10, 10, 10), (40, 25, 25), (40, 100, 50))
+
+TIME_JS = '''
+const engine = window.__easyAutomate;
+const xpaths = arguments[0];
+const repeats = arguments[1];
+function best(fn) {
+    let result = null;
+    for (let i = 0; i < repeats; i++) {
+        const start = performance.now();
+        fn();
+        const elapsed = performance.now() - start;
+        result = result === null ? elapsed : Math.min(result, elapsed);
+    }
+    return result;
+}
+return {
+    native: typeof Element.prototype.checkVisibility === 'function',
+    memo: best(function () { engine.check(xpaths); }),
+    plain: best(function () { xpaths.forEach(engine.checkOne); })
+};
+'''
+
+
+def main(repeats=5):
+    session_id = browser_manager.create_session()
+    driver = browser_manager.get_session(session_id)
+    try:
+        print(f'{"sections":>8} {"depth":>6} {"fields":>7} {"plain ms":>9} {"memo ms":>9} {"speed-up":>9}')
+        for sections, depth, fields in SHAPES:
+            driver.get(f'file://{os.path.abspath(FIXTURE)}?sections={sections}&depth={depth}&fields={fields}')
+            xpaths = [f"//*[@id='field-{s}-{f}']" for s in range(sections) for f in range(fields)]
+            # Install the engine outside of the measurement
+            selector_engine.call(driver, 'check', xpaths[:1])
+            timing = driver.execute_script(TIME_JS, xpaths, repeats)
+            speed_up = timing['plain'] / timing['memo'] if timing['memo'] else float('inf')
+            print(f'{sections:>8} {depth:>6} {fields:>7} {timing["plain"]:>9.1f} {timing["memo"]:>9.1f} {speed_up:>8.1f}x')
+        print('checkVisibility():', 'native' if timing['native'] else 'not supported, ancestor walk')
+    finally:
+        browser_manager.close_session(session_id)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -9,8 +9,14 @@ function registerGetScreenshotNode(RED) {
                 return;
             }
             const apiUrl = (msg.apiUrl || process.env.BROWSER_API_URL || `http://localhost:5000/browser/${sessionId}/screenshot`);
+            // Smaller captures: format (png, jpeg, webp), quality, scale, clip "x,y,width,height"
+            const params = {};
+            for (const key of ["format", "quality", "scale", "clip"]) {
+                const value = (msg[key] !== undefined) ? msg[key] : config[key];
+                if (value !== undefined && value !== "") params[key] = value;
+            }
             try {
-                const response = await axios.get(apiUrl, { responseType: 'arraybuffer' });
+                const response = await axios.get(apiUrl, { params, responseType: 'arraybuffer' });
                 msg.screenshot = Buffer.from(response.data, 'binary');
                 this.send(msg);
             } catch (err) {
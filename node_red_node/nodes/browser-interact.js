@@ -8,6 +8,7 @@ function registerInteractNode(RED) {
             const alias = msg.selector_alias || config.selector_alias;
             const op = msg.interaction || config.interaction || "click"; // click, set-value, get-value
             const value = (msg.value !== undefined) ? msg.value : config.value;
+            const mode = msg.mode || config.mode || "keys"; // keys, direct (set-value only)
             const sessionId = msg.session_id;
             console.log("InteractNode received msg:", msg);
             if (!sessionId || !pageId || !alias) {
@@ -22,7 +23,7 @@ function registerInteractNode(RED) {
                 } else if (op === "set-value") {
                     if (value === undefined) throw new Error("Missing value for set-value");
                     apiUrl = (msg.apiUrl || process.env.BROWSER_API_URL || `http://localhost:5000/browser/${sessionId}/set-value`);
-                    req = axios.post(apiUrl, { page_id: pageId, selector_alias: alias, value });
+                    req = axios.post(apiUrl, { page_id: pageId, selector_alias: alias, value, mode });
                 } else if (op === "get-value") {
                     apiUrl = (msg.apiUrl || process.env.BROWSER_API_URL || `http://localhost:5000/browser/${sessionId}/get-value`);
                     req = axios.post(apiUrl, { page_id: pageId, selector_alias: alias });
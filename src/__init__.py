@@ -17,6 +17,9 @@ def create_app(config_class=Config):
 
     CORS(app)
 
+    from src.browser_manager import browser_manager
+    browser_manager.init_app(app)
+
     # Register blueprints here
     from src.blueprints.applications import bp as applications_bp
     app.register_blueprint(applications_bp, url_prefix='/api/applications')
@@ -24,6 +27,9 @@ def create_app(config_class=Config):
     from src.blueprints.pages import bp as pages_bp
     app.register_blueprint(pages_bp, url_prefix='/api/pages')
 
+    from src.blueprints.catalog import bp as catalog_bp
+    app.register_blueprint(catalog_bp, url_prefix='/api/catalog')
+
     from src.blueprints.browser import bp as browser_bp
     app.register_blueprint(browser_bp, url_prefix='/api/browser')
 
@@ -31,6 +37,9 @@ def create_app(config_class=Config):
     from src.blueprints.socketio import websocket_bp
     app.register_blueprint(websocket_bp)
 
+    from src.commands import selectors_cli
+    app.cli.add_command(selectors_cli)
+
     return app
 
 from src import models
\ No newline at end of file
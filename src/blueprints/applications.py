@@ -1,6 +1,11 @@
 from flask import Blueprint, request, jsonify
 from src import db
-from src.models import Application
+from src.models import Application, Page, CatalogChange
+from src.page_index import page_index
+from src.browser_manager import browser_manager
+from src.http_utils import not_modified, send_body, send_json
+from src.listing import ListingError, list_etag, list_options, next_page_headers, paginate
+from src.blueprints.pages import list_pages
 
 bp = Blueprint('applications', __name__)
 
@@ -14,14 +19,35 @@ def create_application():
 
     app = Application(name=data['name'])
     db.session.add(app)
+    db.session.flush()
+    CatalogChange.record('application', app.id, 'created')
     db.session.commit()
 
     return jsonify(app.to_dict()), 201
 
 @bp.route('', methods=['GET'])
 def get_applications():
-    apps = Application.query.all()
-    return jsonify([app.to_dict() for app in apps])
+    try:
+        fields, limit, cursor = list_options(Application)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    etag = list_etag()
+    if not_modified(etag):
+        return send_body(b'', 'application/json', etag)
+    query = Application.query
+    name_prefix = request.args.get('name_prefix')
+    if name_prefix:
+        query = query.filter(Application.name.startswith(name_prefix, autoescape=True))
+    apps, next_cursor = paginate(query, Application, limit, cursor)
+    response = send_json([app.to_dict(fields) for app in apps], etag)
+    response.headers.update(next_page_headers(next_cursor))
+    return response
+
+@bp.route('/<int:id>/pages', methods=['GET'])
+def get_application_pages(id):
+    # Same options as GET /api/pages, scoped by the application's pages relationship
+    app = Application.query.get_or_404(id)
+    return list_pages(app.pages)
 
 @bp.route('/<int:id>', methods=['GET'])
 def get_application(id):
@@ -38,12 +64,21 @@ def update_application(id):
             return jsonify({'error': 'Application with this name already exists'}), 400
         app.name = data['name']
 
+    CatalogChange.record('application', id, 'updated')
     db.session.commit()
     return jsonify(app.to_dict())
 
 @bp.route('/<int:id>', methods=['DELETE'])
 def delete_application(id):
     app = Application.query.get_or_404(id)
+    page_ids = [page.id for page in app.pages.with_entities(Page.id)]
     db.session.delete(app)
+    CatalogChange.record('application', id, 'deleted')
+    for page_id in page_ids:
+        CatalogChange.record('page', page_id, 'deleted')
     db.session.commit()
+    # Deleting an application cascades to its pages
+    page_index.invalidate()
+    for page_id in page_ids:
+        browser_manager.invalidate_page(page_id)
     return '', 204
\ No newline at end of file
@@ -1,10 +1,20 @@
-from src.browser_actions import BrowserActions
+from src.browser_actions import BrowserActions, SET_VALUE_MODES, SCREENSHOT_FORMATS, PILLOW_REQUIRED, parse_timeout
 import uuid
 import os
+import time
 import base64
-from flask import Blueprint, jsonify, request, Response
-from src.browser_manager import browser_manager
+import hashlib
+import json
+from flask import Blueprint, jsonify, request, Response, current_app
+from src.browser_manager import browser_manager, SessionNotFoundError
+from src.session_executor import SessionBusyError, SessionClosedError
+from src.hub_scheduler import NoCapacityError
 from src.models import Page
+from src.page_index import PageIndex, page_index
+from src.locators import selector_locator
+from src.dom_cleaner import iter_clean_dom
+from src.dom_snapshots import diff
+from src.http_utils import send_body, send_json
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -12,12 +22,52 @@ from selenium.common.exceptions import NoSuchElementException, TimeoutException
 
 bp = Blueprint('browser', __name__)
 
+@bp.errorhandler(SessionNotFoundError)
+@bp.errorhandler(SessionClosedError)
+def session_not_found(e):
+    return jsonify({'error': 'Session not found'}), 404
+
+@bp.errorhandler(SessionBusyError)
+def session_busy(e):
+    return jsonify({'error': str(e)}), 429
+
+@bp.errorhandler(NoCapacityError)
+def no_capacity(e):
+    return jsonify({'error': str(e)}), 503
+
+def _run(session_id, fn):
+    # Runs fn(actions) on the session's command thread inside an app context
+    app = current_app._get_current_object()
+    element_cache = browser_manager.get_element_cache(session_id)
+    def task(driver):
+        with app.app_context():
+            return fn(BrowserActions(driver, element_cache))
+    return browser_manager.execute(session_id, task)
+
 @bp.route('/open', methods=['POST'])
 def open_session():
     data = request.get_json() or {}
     timeout = data.get('timeout')  # Defaults to None if not present
     session_id = browser_manager.create_session(timeout=timeout)
-    return jsonify({'session_id': session_id}), 201
+    return jsonify({
+        'session_id': session_id,
+        'ttl': browser_manager.session_ttl or None,
+        'timeout': timeout
+    }), 201
+
+@bp.route('/pool', methods=['GET'])
+def pool_stats():
+    return jsonify(browser_manager.pool_stats())
+
+@bp.route('/endpoints', methods=['GET'])
+def endpoint_stats():
+    return jsonify(browser_manager.endpoint_stats())
+
+@bp.route('/<string:session_id>/element-cache', methods=['GET'])
+def element_cache_stats(session_id):
+    if not browser_manager.get_session(session_id):
+        return jsonify({'error': 'Session not found'}), 404
+    return jsonify(browser_manager.get_element_cache(session_id).stats())
 
 @bp.route('/<string:session_id>/close', methods=['POST'])
 def close_session(session_id):
@@ -26,103 +76,161 @@ def close_session(session_id):
 
 @bp.route('/<string:session_id>/navigate', methods=['POST'])
 def navigate_to_page(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
     data = request.get_json() or {}
     page_id = data.get('page_id')
     if not page_id:
         return jsonify({'error': 'Missing page_id'}), 400
-    success, error = actions.navigate_to_page(page_id)
+    success, error = _run(session_id, lambda actions: actions.navigate_to_page(page_id))
     if not success:
         return jsonify({'error': error}), 400
     return '', 204
 
-def _find_selector(page, alias):
-    selectors = page.identifying_selectors + (page.interactive_selectors or [])
-    for selector in selectors:
-        if selector.get('alias') == alias:
-            return selector.get('xpath')
-    return None
-
 @bp.route('/<string:session_id>/click', methods=['POST'])
 def click_element(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
     data = request.get_json() or {}
     page_id = data.get('page_id')
     alias = data.get('selector_alias')
     if not page_id or not alias:
         return jsonify({'error': 'Missing page_id or selector_alias'}), 400
-    success, error = actions.click_element(page_id, alias)
+    success, error = _run(session_id, lambda actions: actions.click_element(page_id, alias))
     if not success:
         return jsonify({'error': error}), 404
     return '', 204
 
 @bp.route('/<string:session_id>/set-value', methods=['POST'])
 def set_element_value(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
     data = request.get_json() or {}
     page_id = data.get('page_id')
     alias = data.get('selector_alias')
     value = data.get('value')
+    mode = data.get('mode', 'keys')
     if not page_id or not alias or value is None:
         return jsonify({'error': 'Missing page_id, selector_alias, or value'}), 400
-    success, error = actions.set_element_value(page_id, alias, value)
+    if mode not in SET_VALUE_MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(SET_VALUE_MODES)}"}), 400
+    success, error = _run(session_id, lambda actions: actions.set_element_value(page_id, alias, value, mode))
     if not success:
         return jsonify({'error': error}), 404
     return '', 204
 
 @bp.route('/<string:session_id>/get-value', methods=['POST'])
 def get_element_value(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
     data = request.get_json() or {}
     page_id = data.get('page_id')
     alias = data.get('selector_alias')
     if not page_id or not alias:
         return jsonify({'error': 'Missing page_id or selector_alias'}), 400
-    value, error = actions.get_element_value(page_id, alias)
+    value, error = _run(session_id, lambda actions: actions.get_element_value(page_id, alias))
     if error:
         return jsonify({'error': error}), 404
     return jsonify({'value': value})
 
+@bp.route('/<string:session_id>/page-values/<int:page_id>', methods=['GET'])
+def get_page_values(session_id, page_id):
+    values = _run(session_id, lambda actions: actions.get_page_values(page_id))
+    return jsonify({'values': values})
+
+@bp.route('/<string:session_id>/page-values/<int:page_id>', methods=['POST'])
+def set_page_values(session_id, page_id):
+    data = request.get_json() or {}
+    values = data.get('values')
+    if not isinstance(values, dict) or not values:
+        return jsonify({'error': 'Missing values'}), 400
+    if any(value is None for value in values.values()):
+        return jsonify({'error': 'Values must not be null'}), 400
+    mode = data.get('mode', 'keys')
+    if mode not in SET_VALUE_MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(SET_VALUE_MODES)}"}), 400
+    results = _run(session_id, lambda actions: actions.set_page_values(page_id, values, mode))
+    return jsonify({
+        'success': all(result['success'] for result in results.values()),
+        'results': results
+    })
+
 @bp.route('/<string:session_id>/wait-for-page', methods=['POST'])
 def wait_for_page(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
     data = request.get_json() or {}
     page_id = data.get('page_id')
-    timeout = data.get('timeout', 10)
     if not page_id:
         return jsonify({'error': 'Missing page_id'}), 400
-    success, error = actions.wait_for_page(page_id, timeout)
+    try:
+        timeout = parse_timeout(data.get('timeout', 10))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    success, error = _run(session_id, lambda actions: actions.wait_for_page(page_id, timeout))
     if not success:
         return jsonify({'error': error}), 408
     return '', 204
 
+def _is_id(value):
+    # Ids arrive as numbers or, from some clients, as numeric strings
+    if isinstance(value, bool):
+        return False
+    return isinstance(value, int) or (isinstance(value, str) and value.isdigit())
+
+@bp.route('/<string:session_id>/wait-for-any-page', methods=['POST'])
+def wait_for_any_page(session_id):
+    data = request.get_json() or {}
+    page_ids = data.get('page_ids')
+    application_id = data.get('application_id')
+    try:
+        timeout = parse_timeout(data.get('timeout', 10))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if page_ids:
+        if not isinstance(page_ids, list) or not all(_is_id(page_id) for page_id in page_ids):
+            return jsonify({'error': 'page_ids must be a list of page ids'}), 400
+        page_ids = [int(page_id) for page_id in page_ids]
+        pages = {page.id: page for page in Page.query.filter(Page.id.in_(page_ids))}
+        # Keep the caller's order, it decides which page wins when several match at once
+        candidates = [pages[page_id] for page_id in page_ids if page_id in pages]
+    elif application_id:
+        if not _is_id(application_id):
+            return jsonify({'error': 'application_id must be an id'}), 400
+        candidates = Page.query.filter_by(application_id=int(application_id)).order_by(Page.id).all()
+    else:
+        return jsonify({'error': 'Missing page_ids or application_id'}), 400
+    index = PageIndex([page.to_dict() for page in candidates])
+    if not index.pages:
+        return jsonify({'error': 'No candidate page with identifying selectors'}), 400
+
+    start = time.perf_counter()
+    matched = _run(session_id, lambda actions: actions.wait_for_pages(index, timeout))
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
+    if not matched:
+        return jsonify({'error': 'Timeout waiting for any of the pages', 'elapsed_ms': elapsed_ms}), 408
+    return jsonify({'page': matched[0], 'elapsed_ms': elapsed_ms})
+
+@bp.route('/<string:session_id>/batch', methods=['POST'])
+def run_batch(session_id):
+    data = request.get_json() or {}
+    steps = data.get('steps')
+    on_error = data.get('on_error', 'stop')
+    if not isinstance(steps, list) or not steps:
+        return jsonify({'error': 'Missing steps'}), 400
+    if on_error not in ('stop', 'continue'):
+        return jsonify({'error': "on_error must be 'stop' or 'continue'"}), 400
+    collapse = data.get('collapse', True)
+    collapse_clicks = data.get('collapse_clicks', False)
+    start = time.perf_counter()
+    results = _run(session_id, lambda actions: actions.run_batch(steps, on_error == 'stop', collapse, collapse_clicks))
+    return jsonify({
+        'success': all(result['success'] for result in results),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 2),
+        'results': results
+    })
+
 @bp.route('/<string:session_id>/checkSelectors', methods=['GET'])
 def check_selectors(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
+    if not browser_manager.get_session(session_id):
         return jsonify({'error': 'Session not found'}), 404
 
-    # Gather all unique xpaths and build mapping for output
+    # Gather all unique locators and build mapping for output
     pages = Page.query.all()
     selector_set = set()
     # Structure: {app_id: {page_id: {alias: {wanted, actual}}}}
     output = {}
-    selector_map = {}  # xpath -> (app_id, page_id, alias, wanted_visible)
+    selector_map = {}  # (app_id, page_id, alias) -> (locator, wanted_visible)
     for page in pages:
         app_id = str(page.application_id)
         page_id = str(page.id)
@@ -132,104 +240,165 @@ def check_selectors(session_id):
             output[app_id][page_id] = {}
         for selector in page.identifying_selectors or []:
             alias = selector.get('alias')
-            xpath = selector.get('xpath')
+            locator = selector_locator(selector)
             wanted_visible = selector.get('visible', None)
-            if xpath:
-                selector_set.add(xpath)
+            if locator:
+                selector_set.add(locator)
                 # For mapping back after JS execution
-                selector_map[(app_id, page_id, alias)] = (xpath, wanted_visible)
+                selector_map[(app_id, page_id, alias)] = (locator, wanted_visible)
                 output[app_id][page_id][alias] = {
                     "wanted": {"visible": wanted_visible},
                     "actual": None  # to be filled after JS
                 }
 
     selectors = list(selector_set)
-    js_code = BrowserActions._generate_selector_check_js(selectors)
-    try:
-        selector_results = driver.execute_script(js_code)
-        print(selector_results)
-    except Exception:
-        print("\n--- JS CODE DUMP ---\n" + js_code + "\n--- END JS CODE DUMP ---\n")
-        raise
+    selector_results = _run(session_id, lambda actions: actions.check_selectors(selectors))
 
     # Fill in actual results
-    for (app_id, page_id, alias), (xpath, wanted_visible) in selector_map.items():
-        actual = selector_results.get(xpath, {})
+    for (app_id, page_id, alias), (locator, wanted_visible) in selector_map.items():
+        actual = selector_results.get(locator, {})
         output[app_id][page_id][alias]["actual"] = actual
 
-    return jsonify(output)
+    return send_json(output, stream=True)
 
 @bp.route('/<string:session_id>/get-current-page', methods=['GET'])
 def get_current_page(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
+    if not browser_manager.get_session(session_id):
         return jsonify({'error': 'Session not found'}), 404
 
-    from src.browser_actions import BrowserActions
-    actions = BrowserActions(driver)
-    # Get all pages as dicts
-    
-    pages = [page.to_dict() for page in Page.query.all()]
-    matched_pages = actions.get_current_pages(pages)
+    index = page_index.get()
+    matched_pages = _run(session_id, lambda actions: actions.match_pages(index))
     if matched_pages:
         return jsonify(matched_pages)
     
     return jsonify([]), 200
 
+def _screenshot_options():
+    # Parses format, quality, scale, clip and page_id/selector_alias, returns (options, error)
+    args = request.args
+    options = {'image_format': args.get('format', 'png').lower()}
+    if options['image_format'] == 'jpg':
+        options['image_format'] = 'jpeg'
+    if options['image_format'] not in SCREENSHOT_FORMATS:
+        return None, f"format must be one of {', '.join(SCREENSHOT_FORMATS)}"
+    try:
+        options['quality'] = int(args['quality']) if args.get('quality') else None
+    except ValueError:
+        options['quality'] = -1
+    if options['quality'] is not None and not 0 <= options['quality'] <= 100:
+        return None, 'quality must be an integer from 0 to 100'
+    try:
+        options['scale'] = float(args.get('scale') or 1)
+    except ValueError:
+        options['scale'] = 0
+    if not 0 < options['scale'] <= 1:
+        return None, 'scale must be a number greater than 0 and at most 1'
+    if args.get('clip'):
+        try:
+            x, y, width, height = (float(value) for value in args['clip'].split(','))
+        except ValueError:
+            return None, 'clip must be x,y,width,height'
+        if width <= 0 or height <= 0:
+            return None, 'clip must have a positive width and height'
+        options['clip'] = {'x': x, 'y': y, 'width': width, 'height': height}
+    if args.get('selector_alias'):
+        if options.get('clip'):
+            return None, 'clip and selector_alias cannot be combined'
+        page_id = args.get('page_id', type=int)
+        if not page_id:
+            return None, 'Missing or invalid page_id'
+        options['page_id'] = page_id
+        options['alias'] = args['selector_alias']
+    return options, None
+
 @bp.route('/<string:session_id>/screenshot', methods=['GET'])
 def take_screenshot(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
-    screenshot_data, error = actions.take_screenshot()
+    options, error = _screenshot_options()
     if error:
-        return jsonify({'error': error}), 500
-    return Response(screenshot_data, mimetype='image/png')
+        return jsonify({'error': error}), 400
+    known = request.if_none_match
 
+    def capture(actions):
+        # The ETag ties the capture to the DOM revision, scroll position and viewport
+        state = actions.view_state()
+        etag = None
+        if state is not None:
+            etag = hashlib.sha1(json.dumps([state, options], sort_keys=True).encode()).hexdigest()
+            if etag in known:
+                return etag, None, None
+        data, error = actions.take_screenshot(**options)
+        return etag, data, error
+
+    etag, screenshot_data, error = _run(session_id, capture)
+    if error == PILLOW_REQUIRED:
+        return jsonify({'error': error}), 501
+    if error:
+        return jsonify({'error': error}), 500 if error.startswith('Failed') else 404
+    if screenshot_data is None:
+        response = Response(status=304)
+    else:
+        response = Response(screenshot_data, mimetype=SCREENSHOT_FORMATS[options['image_format']])
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+    return response
 
-# New endpoint: cleaned DOM (removes <script> and <img> tags)
 @bp.route('/<string:session_id>/cleaned-dom', methods=['GET'])
 def get_cleaned_dom(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
-    dom, error = actions.get_dom()
-    if error:
-        return jsonify({'error': error}), 500
-    # Clean DOM: remove <script> and <img> tags
-    try:
-        from bs4 import BeautifulSoup
-        soup = BeautifulSoup(dom, 'html.parser')
-        # Remove all <script> tags
-        for script in soup.find_all('script'):
-            script.decompose()
-        # Remove all <img> tags
-        for img in soup.find_all('img'):
-            img.decompose()
-        # Remove all <style> tags
-        for style in soup.find_all('style'):
-            style.decompose()
-        # Remove all <link> tags
-        for link in soup.find_all('link'):
-            link.decompose()
-        # Remove content of all <svg> tags (keep empty svg)
-        for svg in soup.find_all('svg'):
-            svg.clear()
-        # Format output (pretty-print)
-        cleaned_dom = soup.prettify()
-    except Exception as e:
-        return jsonify({'error': f'Failed to clean DOM: {e}'}), 500
-    return Response(cleaned_dom, mimetype='text/html')
+    # Without script, img, style and link tags and with empty svg elements
+    pretty = request.args.get('pretty', 'false').lower() in ('1', 'true', 'yes')
+    source = request.args.get('source', 'browser')
+    if source not in ('browser', 'server'):
+        return jsonify({'error': "source must be 'browser' or 'server'"}), 400
+    dom = None
+    if source == 'browser':
+        dom, error = _run(session_id, lambda actions: actions.get_cleaned_dom())
+        if dom is not None and not pretty:
+            return send_body(dom, 'text/html')
+    if dom is None:
+        # Server side fallback, cleans the full page source while streaming it out
+        dom, error = _run(session_id, lambda actions: actions.get_dom())
+        if error:
+            return jsonify({'error': error}), 500
+    return send_body(iter_clean_dom(dom, pretty), 'text/html')
 
 @bp.route('/<string:session_id>/dom', methods=['GET'])
 def get_dom(session_id):
-    driver = browser_manager.get_session(session_id)
-    if not driver:
-        return jsonify({'error': 'Session not found'}), 404
-    actions = BrowserActions(driver)
-    dom, error = actions.get_dom()
-    if error:
-        return jsonify({'error': error}), 500
-    return Response(dom, mimetype='text/html')
\ No newline at end of file
+    # The ETag is the DOM revision, ?since=<revision> returns the edits since that snapshot
+    since = request.args.get('since')
+    if_none_match = set(request.if_none_match.as_set(include_weak=True))
+    # The browser leaves out the markup for these revisions
+    known = if_none_match | ({since} if since else set())
+    snapshot = _run(session_id, lambda actions: actions.get_dom_snapshot(sorted(known)))
+    if snapshot is None:
+        dom, error = _run(session_id, lambda actions: actions.get_dom())
+        if error:
+            return jsonify({'error': error}), 500
+        return send_body(dom, 'text/html')
+
+    tag = snapshot['tag']
+    if snapshot.get('unchanged') and tag in if_none_match:
+        response = Response(status=304)
+        response.set_etag(tag)
+        return response
+    if snapshot.get('unchanged'):
+        # Still at the ?since= revision
+        response = send_json({'rev': tag, 'since': since, 'edits': []}, etag=tag)
+    else:
+        html = snapshot['html']
+        snapshots = browser_manager.get_dom_snapshots(session_id)
+        if snapshots is not None:
+            snapshots.put(tag, html)
+        if since:
+            base = snapshots.get(since) if snapshots is not None else None
+            # Unknown revisions and changes too large to diff get the whole document
+            edits = diff(base, html) if base is not None else None
+            if edits is None:
+                response = send_json({'rev': tag, 'html': html}, etag=tag)
+            else:
+                response = send_json({'rev': tag, 'since': since, 'edits': edits}, etag=tag)
+        else:
+            response = send_body(html, 'text/html', etag=tag)
+    # Let browsers revalidate every time, they then send If-None-Match on their own
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,254 @@
+import threading
+from flask import Blueprint, request, jsonify, current_app, g, stream_with_context
+from sqlalchemy.exc import SQLAlchemyError
+from src import db
+from src.models import Application, Page, CatalogChange
+from src.page_index import page_index
+from src.browser_manager import browser_manager
+from src.http_utils import send_body
+
+bp = Blueprint('catalog', __name__)
+
+# Lines imported per transaction, and rows read per query while exporting
+IMPORT_BATCH_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+# Errors listed in the import result, the rest is only counted
+MAX_REPORTED_ERRORS = 1000
+# Changes returned by one GET /changes request
+MAX_CHANGES = 1000
+PAGE_FIELDS = ('url', 'can_be_navigated_to', 'identifying_selectors', 'interactive_selectors')
+
+# The catalog is exchanged as NDJSON, one record per line:
+#   {"type": "application", "name": "Shop"}
+#   {"type": "page", "application": "Shop", "name": "Login", "url": ..., "can_be_navigated_to": ...,
+#    "identifying_selectors": [...], "interactive_selectors": [...]}
+# Applications and pages are matched by name, pages within their application.
+
+
+class _RevisionSync:
+    # Last catalog revision this process has seen. Writes of other workers
+    # show up as a newer revision, their pages' cached selectors are dropped
+    def __init__(self):
+        self.revision = None
+        self._lock = threading.Lock()
+
+    def observe(self, revision):
+        with self._lock:
+            previous, self.revision = self.revision, revision
+        if previous is None or revision <= previous:
+            return
+        page_ids = {change.entity_id for change in CatalogChange.since(previous) if change.entity == 'page'}
+        for page_id in page_ids:
+            browser_manager.invalidate_page(page_id)
+
+
+revision_sync = _RevisionSync()
+
+
+@bp.before_app_request
+def read_catalog_revision():
+    try:
+        g.catalog_revision = CatalogChange.current()
+    except SQLAlchemyError as e:
+        # e.g. a database that was not migrated yet, the API reports that itself
+        db.session.rollback()
+        current_app.logger.debug('Catalog revision unavailable: %s', e)
+        return
+    revision_sync.observe(g.catalog_revision)
+
+
+@bp.after_app_request
+def send_catalog_revision(response):
+    # Revision after the request's own writes, clients compare it to the one they hold
+    if 'catalog_revision' in g:
+        if request.method != 'GET':
+            g.catalog_revision = CatalogChange.current()
+        response.headers['X-Catalog-Revision'] = str(g.catalog_revision)
+    return response
+
+
+@bp.route('/changes', methods=['GET'])
+def get_changes():
+    """Changes after ?since=, oldest first. 'revision' is the revision the
+    client has caught up to; 'more' tells to ask again from there."""
+    since = request.args.get('since', '0')
+    if not since.isdigit():
+        return jsonify({'error': 'since must be a revision number'}), 400
+    changes = CatalogChange.since(int(since), MAX_CHANGES + 1)
+    more = len(changes) > MAX_CHANGES
+    changes = changes[:MAX_CHANGES]
+    revision = changes[-1].id if changes else CatalogChange.current()
+    return jsonify({'revision': revision, 'changes': [change.to_dict() for change in changes], 'more': more})
+
+
+def _export_lines():
+    for app in Application.query.order_by(Application.id).yield_per(EXPORT_BATCH_SIZE):
+        yield current_app.json.dumps({'type': 'application', 'name': app.name}) + '\n'
+        pages = Page.query.filter_by(application_id=app.id).order_by(Page.id).yield_per(EXPORT_BATCH_SIZE)
+        for page in pages:
+            record = {'type': 'page', 'application': app.name, 'name': page.name}
+            record.update(page.to_dict(PAGE_FIELDS))
+            yield current_app.json.dumps(record) + '\n'
+
+
+@bp.route('/export', methods=['GET'])
+def export_catalog():
+    # Streamed row batch by row batch, the catalog is never held in memory
+    return send_body(stream_with_context(_export_lines()), 'application/x-ndjson')
+
+
+def _parse_line(line):
+    try:
+        record = current_app.json.loads(line)
+    except ValueError:
+        raise ValueError('Invalid JSON')
+    if not isinstance(record, dict):
+        raise ValueError('Record must be an object')
+    if not isinstance(record.get('name'), str) or not record['name']:
+        raise ValueError('Missing name')
+    if record.get('type') == 'page':
+        if not isinstance(record.get('application'), str):
+            raise ValueError('Missing application')
+        # Checked here so a bad value costs this line only, not a database round trip
+        if record.get('url') is not None and not isinstance(record['url'], str):
+            raise ValueError('url must be a string or null')
+        if 'can_be_navigated_to' in record and not isinstance(record['can_be_navigated_to'], bool):
+            raise ValueError('can_be_navigated_to must be true or false')
+        for key in ('identifying_selectors', 'interactive_selectors'):
+            selectors = record.get(key, [])
+            if not isinstance(selectors, list) or not all(isinstance(s, dict) for s in selectors):
+                raise ValueError(f'{key} must be a list of objects')
+            for selector in selectors:
+                if not all(isinstance(value, (str, bool)) for value in selector.values()):
+                    raise ValueError(f'{key} values must be strings or booleans')
+    elif record.get('type') != 'application':
+        raise ValueError(f'Unknown type: {record.get("type")}')
+    return record
+
+
+class _Import:
+    """Upserts the records of one import request batch by batch; the state
+    kept between batches is the application ids by name and the summary."""
+
+    def __init__(self):
+        self.application_ids = {}
+        self.summary = {'applications': {'created': 0, 'updated': 0}, 'pages': {'created': 0, 'updated': 0},
+                        'errors': [], 'error_count': 0}
+
+    def error(self, line_number, message):
+        self.summary['error_count'] += 1
+        if len(self.summary['errors']) < MAX_REPORTED_ERRORS:
+            self.summary['errors'].append({'line': line_number, 'error': message})
+
+    def _application_id(self, name):
+        if name not in self.application_ids:
+            app = Application.query.filter_by(name=name).first()
+            self.application_ids[name] = app.id if app else None
+        return self.application_ids[name]
+
+    def _upsert_application(self, record):
+        if self._application_id(record['name']) is not None:
+            return 'updated'
+        app = Application(name=record['name'])
+        db.session.add(app)
+        db.session.flush()
+        CatalogChange.record('application', app.id, 'created')
+        self.application_ids[app.name] = app.id
+        return 'created'
+
+    def _upsert_page(self, record, application_id, existing):
+        page = existing.get((application_id, record['name']))
+        action = 'created' if page is None else 'updated'
+        if page is None:
+            page = Page(name=record['name'], application_id=application_id)
+            db.session.add(page)
+        for field in PAGE_FIELDS:
+            if field in record:
+                setattr(page, field, record[field])
+        db.session.flush()
+        CatalogChange.record('page', page.id, action)
+        existing[(application_id, page.name)] = page
+        return page, action
+
+    def run_batch(self, records):
+        _begin()
+        counts = {'applications': {'created': 0, 'updated': 0}, 'pages': {'created': 0, 'updated': 0}}
+        ids_before = dict(self.application_ids)
+        # Pages of the batch that already exist, fetched with one query
+        names = {record['name'] for _, record in records if record['type'] == 'page'}
+        existing = {(page.application_id, page.name): page
+                    for page in Page.query.filter(Page.name.in_(names))} if names else {}
+        updated_pages = set()
+        for line_number, record in records:
+            if record['type'] == 'page':
+                application_id = self._application_id(record['application'])
+                if application_id is None:
+                    self.error(line_number, f'Application not found: {record["application"]}')
+                    continue
+            # A savepoint per line, a line the database refuses is skipped alone
+            ids = dict(self.application_ids)
+            try:
+                with db.session.begin_nested():
+                    if record['type'] == 'application':
+                        counts['applications'][self._upsert_application(record)] += 1
+                        continue
+                    page, action = self._upsert_page(record, application_id, existing)
+            except SQLAlchemyError as e:
+                self.application_ids = ids
+                self.error(line_number, f'Not saved: {_short_error(e)}')
+                continue
+            counts['pages'][action] += 1
+            if action == 'updated':
+                updated_pages.add(page.id)
+        try:
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            self.application_ids = ids_before
+            for line_number, _ in records:
+                self.error(line_number, f'Batch rolled back: {_short_error(e)}')
+            return
+        for kind in counts:
+            for key, count in counts[kind].items():
+                self.summary[kind][key] += count
+        for page_id in updated_pages:
+            browser_manager.invalidate_page(page_id)
+        # Keep memory flat, nothing of this batch is needed again
+        db.session.expunge_all()
+
+
+def _begin():
+    # pysqlite sends BEGIN before DML only, not before SAVEPOINT, so every
+    # released savepoint would commit on its own. Open the batch transaction first
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN')
+
+
+def _short_error(e):
+    # The driver's message without the SQL statement and parameters SQLAlchemy appends
+    message = str(getattr(e, 'orig', None) or type(e).__name__)
+    return message.splitlines()[0][:200]
+
+
+@bp.route('/import', methods=['POST'])
+def import_catalog():
+    """Upsert the NDJSON catalog in the request body, IMPORT_BATCH_SIZE lines
+    per transaction. Invalid lines are reported and skipped."""
+    catalog_import = _Import()
+    batch = []
+    for line_number, line in enumerate(request.stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            batch.append((line_number, _parse_line(line)))
+        except ValueError as e:
+            catalog_import.error(line_number, str(e))
+            continue
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            catalog_import.run_batch(batch)
+            batch = []
+    if batch:
+        catalog_import.run_batch(batch)
+    page_index.invalidate()
+    return jsonify(catalog_import.summary)
@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify
 from src import db
-from src.models import Page, Application
+from src.models import Page, Application, Selector, CatalogChange
+from src.page_index import page_index
+from src.browser_manager import browser_manager
+from src.http_utils import not_modified, send_body, send_json
+from src.listing import ListingError, list_etag, list_options, next_page_headers, paginate
 
 bp = Blueprint('pages', __name__)
 
@@ -25,14 +29,45 @@ def create_page():
     )
 
     db.session.add(page)
+    db.session.flush()
+    CatalogChange.record('page', page.id, 'created')
     db.session.commit()
+    page_index.invalidate()
 
     return jsonify(page.to_dict()), 201
 
 @bp.route('', methods=['GET'])
 def get_pages():
-    pages = Page.query.all()
-    return jsonify([page.to_dict() for page in pages])
+    return list_pages(Page.query)
+
+def list_pages(query):
+    """Page list of query, narrowed by ?application_id=, ?name_prefix= and
+    ?xpath= and shaped by ?fields=, ?limit= and ?cursor=."""
+    try:
+        fields, limit, cursor = list_options(Page)
+    except ListingError as e:
+        return jsonify({'error': str(e)}), 400
+    etag = list_etag()
+    if not_modified(etag):
+        return send_body(b'', 'application/json', etag)
+    application_id = request.args.get('application_id')
+    if application_id:
+        if not application_id.isdigit():
+            return jsonify({'error': 'application_id must be an integer'}), 400
+        query = query.filter(Page.application_id == int(application_id))
+    name_prefix = request.args.get('name_prefix')
+    if name_prefix:
+        query = query.filter(Page.name.startswith(name_prefix, autoescape=True))
+    # ?xpath= lists the pages using that XPath, answered by the selector index
+    xpath = request.args.get('xpath')
+    if xpath:
+        query = query.filter(Page.selectors.any(Selector.xpath == xpath))
+    if fields is not None and not set(fields) & set(Page.SELECTOR_FIELDS):
+        query = query.options(db.noload(Page.selectors))
+    pages, next_cursor = paginate(query, Page, limit, cursor)
+    response = send_json([page.to_dict(fields) for page in pages], etag)
+    response.headers.update(next_page_headers(next_cursor))
+    return response
 
 @bp.route('/<int:id>', methods=['GET'])
 def get_page(id):
@@ -47,15 +82,24 @@ def update_page(id):
     page.name = data.get('name', page.name)
     page.url = data.get('url', page.url)
     page.can_be_navigated_to = data.get('can_be_navigated_to', page.can_be_navigated_to)
-    page.identifying_selectors = data.get('identifying_selectors', page.identifying_selectors)
-    page.interactive_selectors = data.get('interactive_selectors', page.interactive_selectors)
+    # Selector rows are only replaced when the request carries them
+    if 'identifying_selectors' in data:
+        page.identifying_selectors = data['identifying_selectors']
+    if 'interactive_selectors' in data:
+        page.interactive_selectors = data['interactive_selectors']
 
+    CatalogChange.record('page', id, 'updated')
     db.session.commit()
+    page_index.invalidate()
+    browser_manager.invalidate_page(id)
     return jsonify(page.to_dict())
 
 @bp.route('/<int:id>', methods=['DELETE'])
 def delete_page(id):
     page = Page.query.get_or_404(id)
     db.session.delete(page)
+    CatalogChange.record('page', id, 'deleted')
     db.session.commit()
+    page_index.invalidate()
+    browser_manager.invalidate_page(id)
     return '', 204
\ No newline at end of file
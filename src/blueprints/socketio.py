@@ -1,12 +1,28 @@
 
 from flask import Blueprint, send_from_directory, current_app
 from flask_sock import Sock
+import json
 import threading
 import time
+from src.browser_manager import browser_manager, SessionNotFoundError
+from src.page_index import page_index
+from src.page_watcher import PageWatch
+from src.screencast import Screencast
+from src import db
+from src.models import CatalogChange
+from src.blueprints.catalog import MAX_CHANGES
 
 websocket_bp = Blueprint('socketio', __name__)
 sock = Sock()
 
+# Seconds between reads of the watched sessions' page status
+WATCH_POLL_INTERVAL = 0.25
+# Seconds between checks for screencast frames, bounds the achievable frame rate
+SCREENCAST_POLL_INTERVAL = 0.02
+SCREENCAST_MAX_FPS = 10
+# Seconds between reads of the catalog revision for catalog subscribers
+CATALOG_POLL_INTERVAL = 1.0
+
 
 
 # Serve any file from the static folder using the root endpoint
@@ -25,11 +41,150 @@ def static_files(filename):
 
 
 # Standard WebSocket endpoint using Flask-Sock
+#
+# Clients can subscribe to a browser session with
+#   {"action": "subscribe", "session_id": "...", "debounce": 150}
+# and then receive {"event": "current-page", "session_id": "...", "pages": [...]}
+# whenever the set of matched pages changes. The browser watches DOM mutations
+# and URL changes itself, so no polling requests are needed.
+#
+# {"action": "screencast", "session_id": "...", "fps": 2, "scale": 0.5, "quality": 60}
+# streams {"event": "frame", "session_id": "...", "format": "jpeg", "data": "<base64>", "timestamp": ...}
+# until {"action": "stop-screencast", "session_id": "..."}. Frames that cannot be
+# delivered in time are dropped rather than queued.
+#
+# {"action": "subscribe-catalog", "since": 42} sends
+# {"event": "catalog-changes", "revision": ..., "changes": [...]} with the changes
+# to applications and pages after that revision (or after the current one when
+# since is left out), the same records as GET /api/catalog/changes.
+# {"action": "unsubscribe-catalog"} stops them.
 @sock.route('/ws')
 def websocket(ws):
-	while True:
-		ws.send('{"message": "ping"}')
-		current_app.logger.info('Ping event sent to WebSocket client')
-		time.sleep(5)
+	watches = {}
+	screencasts = {}
+	catalog = {}
+	last_ping = 0
+	last_watch_poll = 0
+	last_catalog_poll = 0
+	try:
+		while True:
+			message = ws.receive(timeout=SCREENCAST_POLL_INTERVAL if screencasts else WATCH_POLL_INTERVAL)
+			if message:
+				_handle_message(ws, watches, screencasts, catalog, message)
+			if watches and time.monotonic() - last_watch_poll >= WATCH_POLL_INTERVAL:
+				_poll_watches(ws, watches)
+				last_watch_poll = time.monotonic()
+			if screencasts:
+				_poll_screencasts(ws, screencasts)
+			if catalog and time.monotonic() - last_catalog_poll >= CATALOG_POLL_INTERVAL:
+				_poll_catalog(ws, catalog)
+				last_catalog_poll = time.monotonic()
+			if time.monotonic() - last_ping >= 5:
+				ws.send('{"message": "ping"}')
+				current_app.logger.info('Ping event sent to WebSocket client')
+				last_ping = time.monotonic()
+	finally:
+		for watch in list(watches.values()) + list(screencasts.values()):
+			watch.cancel()
+
+def _screencast_options(data):
+	fps = data.get('fps', 2)
+	scale = data.get('scale', 0.5)
+	quality = data.get('quality', 60)
+	numbers = all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (fps, scale, quality))
+	if not numbers or not 0 < fps <= SCREENCAST_MAX_FPS or not 0 < scale <= 1 or not 0 <= quality <= 100:
+		return None
+	return {'fps': fps, 'scale': scale, 'quality': int(quality)}
+
+def _handle_message(ws, watches, screencasts, catalog, message):
+	try:
+		data = json.loads(message)
+	except ValueError:
+		ws.send(json.dumps({'event': 'error', 'error': 'Invalid JSON'}))
+		return
+	action = data.get('action')
+	session_id = data.get('session_id')
+	if action == 'subscribe':
+		if not session_id or not browser_manager.get_session(session_id):
+			ws.send(json.dumps({'event': 'error', 'error': 'Session not found', 'session_id': session_id}))
+			return
+		watches[session_id] = PageWatch(session_id, data.get('debounce', 150))
+		ws.send(json.dumps({'event': 'subscribed', 'session_id': session_id}))
+	elif action == 'unsubscribe':
+		watch = watches.pop(session_id, None)
+		if watch:
+			watch.cancel()
+		ws.send(json.dumps({'event': 'unsubscribed', 'session_id': session_id}))
+	elif action == 'screencast':
+		if not session_id or not browser_manager.get_session(session_id):
+			ws.send(json.dumps({'event': 'error', 'error': 'Session not found', 'session_id': session_id}))
+			return
+		options = _screencast_options(data)
+		if options is None:
+			ws.send(json.dumps({'event': 'error', 'session_id': session_id,
+				'error': f'fps must be in (0, {SCREENCAST_MAX_FPS}], scale in (0, 1] and quality in [0, 100]'}))
+			return
+		previous = screencasts.pop(session_id, None)
+		if previous:
+			previous.cancel()
+		screencasts[session_id] = Screencast(session_id, **options)
+		ws.send(json.dumps({'event': 'screencast-started', 'session_id': session_id, **options}))
+	elif action == 'stop-screencast':
+		screencast = screencasts.pop(session_id, None)
+		if screencast:
+			screencast.cancel()
+		ws.send(json.dumps({'event': 'screencast-stopped', 'session_id': session_id}))
+	elif action == 'subscribe-catalog':
+		since = data.get('since')
+		if since is not None and (not isinstance(since, int) or isinstance(since, bool) or since < 0):
+			ws.send(json.dumps({'event': 'error', 'error': 'since must be a revision number'}))
+			return
+		revision = CatalogChange.current()
+		db.session.rollback()
+		catalog['revision'] = revision if since is None else since
+		ws.send(json.dumps({'event': 'catalog-subscribed', 'revision': revision}))
+	elif action == 'unsubscribe-catalog':
+		catalog.clear()
+		ws.send(json.dumps({'event': 'catalog-unsubscribed'}))
+	else:
+		ws.send(json.dumps({'event': 'error', 'error': f'Unknown action: {action}'}))
+
+def _poll_watches(ws, watches):
+	index = page_index.get()
+	for session_id, watch in list(watches.items()):
+		try:
+			pages = watch.poll(index)
+		except SessionNotFoundError:
+			del watches[session_id]
+			ws.send(json.dumps({'event': 'session-closed', 'session_id': session_id}))
+			continue
+		except Exception as e:
+			# e.g. the document was replaced while the status was read, retried on the next poll
+			current_app.logger.debug('Page watch for session %s failed: %s', session_id, e)
+			continue
+		if pages is not None:
+			ws.send(json.dumps({'event': 'current-page', 'session_id': session_id, 'pages': pages}))
+
+def _poll_screencasts(ws, screencasts):
+	for session_id, screencast in list(screencasts.items()):
+		try:
+			frame = screencast.poll()
+		except SessionNotFoundError:
+			del screencasts[session_id]
+			ws.send(json.dumps({'event': 'session-closed', 'session_id': session_id}))
+			continue
+		except Exception as e:
+			current_app.logger.debug('Screencast of session %s failed: %s', session_id, e)
+			continue
+		if frame is not None:
+			ws.send(json.dumps({'event': 'frame', 'session_id': session_id, **frame}))
+
+def _poll_catalog(ws, catalog):
+	changes = [change.to_dict() for change in CatalogChange.since(catalog['revision'], MAX_CHANGES)]
+	# Ends the read transaction so the next poll sees later commits
+	db.session.rollback()
+	if changes:
+		catalog['revision'] = changes[-1]['revision']
+		ws.send(json.dumps({'event': 'catalog-changes', 'revision': catalog['revision'], 'changes': changes}))
 
 # To use: call sock.init_app(app) in your app factory after registering blueprints
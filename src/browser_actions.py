@@ -1,75 +1,380 @@
 from src.browser_manager import browser_manager
-from src.models import Page
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
+from src.models import Page, Selector
+from src import selector_engine
+from src.page_index import PageIndex
+from src.element_cache import ElementCache
+from src.locators import selector_locator, to_by
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.common.exceptions import NoSuchElementException, TimeoutException, JavascriptException, \
+    StaleElementReferenceException, WebDriverException
+from werkzeug.exceptions import NotFound
+import base64
+import io
+import math
+import time
+import weakref
+
+# Steps of a batch that leave the page as it is and can share one execute_script
+# round trip, set-value steps join them in direct mode. Clicks only join on request:
+# in-page el.click() is an untrusted event without scrolling or interactability
+# checks, and later steps of the same script run before the page reacted to it
+DOM_STEP_ACTIONS = ('get-value',)
+BATCH_ACTIONS = ('navigate', 'wait-for-page', 'click', 'set-value', 'get-value')
+# keys types the value like a user, direct assigns it and fires input/change events
+SET_VALUE_MODES = ('keys', 'direct')
+SCREENSHOT_FORMATS = {'png': 'image/png', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+# Converting a WebDriver PNG without Chrome DevTools needs the optional Pillow package
+PILLOW_REQUIRED = 'Converting, scaling or clipping screenshots without Chrome DevTools requires Pillow'
+TIMEOUT_ERROR = 'timeout must be a positive number of seconds'
+# Remote drivers whose Grid refused DevTools commands, not asked again
+_REMOTE_CDP_REFUSED = weakref.WeakSet()
 
 class BrowserActions:
 
-    def __init__(self, driver):
+    def __init__(self, driver, element_cache=None):
         self.driver = driver
+        self.element_cache = element_cache if element_cache is not None else ElementCache()
 
     def navigate_to_page(self, page_id):
         page = Page.query.get_or_404(page_id)
         if not page.can_be_navigated_to or not page.url:
             return False, 'Page cannot be navigated to'
         self.driver.get(page.url)
+        self.element_cache.clear_elements()
         return True, None
 
     def click_element(self, page_id, alias):
-        page = Page.query.get_or_404(page_id)
-        xpath = self._find_selector(page, alias)
-        if not xpath:
-            return False, 'Selector alias not found on page'
-        try:
-            element = self.driver.find_element(By.XPATH, xpath)
-            element.click()
-        except NoSuchElementException:
-            return False, 'Element not found'
+        _, error = self._with_element(page_id, alias, lambda element: element.click())
+        if error:
+            return False, error
         return True, None
 
-    def set_element_value(self, page_id, alias, value):
-        page = Page.query.get_or_404(page_id)
-        xpath = self._find_selector(page, alias)
-        if not xpath:
-            return False, 'Selector alias not found on page'
-        try:
-            element = self.driver.find_element(By.XPATH, xpath)
-            element.clear()
-            element.send_keys(value)
-        except NoSuchElementException:
-            return False, 'Element not found'
+    def set_element_value(self, page_id, alias, value, mode='keys'):
+        if mode not in SET_VALUE_MODES:
+            return False, f'Unknown set-value mode: {mode}'
+        set_value = self._assign_value if mode == 'direct' else self._type_value
+        _, error = self._with_element(page_id, alias, lambda element: set_value(element, value))
+        if error:
+            return False, error
         return True, None
 
+    def _type_value(self, element, value):
+        element.clear()
+        element.send_keys(value)
+
+    def _assign_value(self, element, value):
+        selector_engine.call(self.driver, 'setValue', element, str(value))
+
     def get_element_value(self, page_id, alias):
+        return self._with_element(page_id, alias, lambda element: element.get_attribute('value') or element.text)
+
+    def get_page_values(self, page_id):
+        # Reads every interactive selector of the page in a single script execution
         page = Page.query.get_or_404(page_id)
-        xpath = self._find_selector(page, alias)
-        if not xpath:
-            return None, 'Selector alias not found on page'
+        selectors = [s for s in (page.interactive_selectors or []) if s.get('alias') and selector_locator(s)]
+        outcomes = selector_engine.call(self.driver, 'readValues', [selector_locator(s) for s in selectors])
+        values = {}
+        for selector, outcome in zip(selectors, outcomes):
+            if outcome.get('existing'):
+                values[selector['alias']] = {
+                    'value': outcome.get('value'),
+                    'text': outcome.get('text'),
+                    'visible': outcome.get('visible', False)
+                }
+            else:
+                values[selector['alias']] = {'error': outcome.get('error') or 'Element not found'}
+        return values
+
+    def set_page_values(self, page_id, values, mode='keys'):
+        # Fills alias -> value in order, reporting every alias separately
+        Page.query.get_or_404(page_id)
+        results = {}
+        for alias, value in values.items():
+            success, error = self.set_element_value(page_id, alias, value, mode)
+            results[alias] = {'success': True} if success else {'success': False, 'error': error}
+        return results
+
+    def _with_element(self, page_id, alias, fn):
+        # Runs fn(element) on the element behind (page_id, alias), looking it up
+        # again once when the cached reference turned out to be stale
+        for _ in range(2):
+            element, error = self._locate(page_id, alias)
+            if error:
+                return None, error
+            try:
+                return fn(element), None
+            except StaleElementReferenceException:
+                self.element_cache.forget_element(page_id, alias)
+        return None, 'Element not found'
+
+    def _locate(self, page_id, alias):
+        cached = self.element_cache.get(page_id, alias)
+        if cached and cached['element'] is not None:
+            self.element_cache.record(hit=True)
+            return cached['element'], None
+        self.element_cache.record(hit=False)
+        locator, error = self._resolve_selector(page_id, alias, cached)
+        if error:
+            return None, error
         try:
-            element = self.driver.find_element(By.XPATH, xpath)
-            value = element.get_attribute('value') or element.text
+            element = self.driver.find_element(*to_by(locator))
         except NoSuchElementException:
             return None, 'Element not found'
-        return value, None
+        self.element_cache.put(page_id, alias, locator, element)
+        return element, None
+
+    def _resolve_selector(self, page_id, alias, cached=None):
+        if cached is None:
+            cached = self.element_cache.get(page_id, alias)
+        if cached:
+            return cached['locator'], None
+        # Indexed lookup of the one selector instead of loading the page's lists
+        selector = Selector.find(page_id, alias)
+        if selector is not None:
+            selector = selector.to_dict()
+        else:
+            page = Page.query.get_or_404(page_id)
+            # Pages not moved to selector rows yet keep their selectors in JSON
+            legacy = page.identifying_selectors + page.interactive_selectors if page.has_legacy_selectors else []
+            selector = next((s for s in legacy if s.get('alias') == alias), None)
+            if selector is None:
+                return None, 'Selector alias not found on page'
+        locator = selector_locator(selector)
+        if not locator:
+            return None, 'Selector alias not found on page'
+        self.element_cache.put(page_id, alias, locator)
+        return locator, None
 
     def wait_for_page(self, page_id, timeout=10):
         page = Page.query.get_or_404(page_id)
-        try:
-            wait = WebDriverWait(self.driver, timeout)
-            for selector in page.identifying_selectors:
-                wait.until(EC.presence_of_element_located((By.XPATH, selector['xpath'])))
-        except TimeoutException:
+        if not page.identifying_selectors:
+            return True, None
+        matched = self.wait_for_pages(PageIndex([page.to_dict()]), timeout)
+        if not matched:
             return False, 'Timeout waiting for page to load'
         return True, None
 
-    def take_screenshot(self):
+    def wait_for_pages(self, index, timeout=10):
+        # Blocks in the browser until a page of the index matches, using the
+        # same rules as get_current_pages. Returns the matched pages, or an
+        # empty list on timeout.
+        if not index.pages:
+            return []
+        plan = index.plan()
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            # Leave the in-page timer room to answer before WebDriver gives up
+            self.driver.set_script_timeout(remaining + 5)
+            try:
+                outcome = selector_engine.call_async(self.driver, 'waitForPages', plan, int(remaining * 1000))
+            except JavascriptException:
+                # The document was replaced while waiting, wait again in the new one
+                time.sleep(0.05)
+                continue
+            except TimeoutException:
+                return []
+            if outcome.get('timeout'):
+                return []
+            return [index.pages[i] for i in outcome['matched']]
+
+    def run_batch(self, steps, stop_on_error=True, collapse=True, collapse_clicks=False):
+        # Runs the steps in order and returns one result per step. Contiguous
+        # get-value and direct set-value steps (and clicks with collapse_clicks)
+        # are collapsed into a single script execution.
+        results = []
+        group = []
+
+        def flush():
+            if group:
+                results.extend(self._run_dom_steps(group, stop_on_error))
+                group.clear()
+            return stop_on_error and any(not result['success'] for result in results)
+
+        for position, step in enumerate(steps):
+            action = step.get('action') if isinstance(step, dict) else None
+            dom_step = collapse and self._is_dom_step(step, collapse_clicks)
+            if dom_step:
+                locator, error = self._resolve_step_selector(step)
+                if error is None:
+                    group.append((position, step, locator))
+                    continue
+            if flush():
+                break
+            if dom_step:
+                results.append(self._step_result(position, action, False, error=error))
+            else:
+                results.append(self._run_step(position, step))
+            if stop_on_error and not results[-1]['success']:
+                break
+        flush()
+
+        for position in range(len(results), len(steps)):
+            step = steps[position]
+            action = step.get('action') if isinstance(step, dict) else None
+            results.append(self._step_result(position, action, False, error='Skipped after previous error', skipped=True))
+        return results
+
+    def _run_step(self, position, step):
+        action = step.get('action') if isinstance(step, dict) else None
+        if action not in BATCH_ACTIONS:
+            return self._step_result(position, action, False, error=f'Unknown action: {action}')
+        page_id = step.get('page_id')
+        alias = step.get('selector_alias')
+        if not page_id or (action in ('click', 'set-value', 'get-value') and not alias):
+            return self._step_result(position, action, False, error='Missing page_id or selector_alias')
+        if action == 'set-value' and step.get('value') is None:
+            return self._step_result(position, action, False, error='Missing value')
+        value = None
+        start = time.perf_counter()
+        try:
+            if action == 'navigate':
+                success, error = self.navigate_to_page(page_id)
+            elif action == 'wait-for-page':
+                success, error = self.wait_for_page(page_id, parse_timeout(step.get('timeout', 10)))
+            elif action == 'click':
+                success, error = self.click_element(page_id, alias)
+            elif action == 'set-value':
+                success, error = self.set_element_value(page_id, alias, step['value'], step.get('mode', 'keys'))
+            else:
+                value, error = self.get_element_value(page_id, alias)
+                success = error is None
+        except NotFound:
+            success, error = False, 'Page not found'
+        except (WebDriverException, TypeError, ValueError) as e:
+            # e.g. an element that cannot be clicked; a failed step, on_error decides what follows
+            success, error = False, _step_error(e)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        return self._step_result(position, action, success, error=error, value=value, elapsed_ms=elapsed_ms)
+
+    @staticmethod
+    def _is_dom_step(step, collapse_clicks=False):
+        action = step.get('action') if isinstance(step, dict) else None
+        if action == 'set-value':
+            return step.get('mode') == 'direct' and step.get('value') is not None
+        return action in DOM_STEP_ACTIONS or (collapse_clicks and action == 'click')
+
+    def _run_dom_steps(self, group, stop_on_error):
+        script_steps = [
+            {'op': step['action'], 'locator': locator, 'value': None if step.get('value') is None else str(step['value'])}
+            for _, step, locator in group
+        ]
+        try:
+            outcomes = selector_engine.call(self.driver, 'runSteps', script_steps, stop_on_error)
+        except WebDriverException as e:
+            # e.g. the page navigated away under the script, none of its steps is known to have run
+            error = _step_error(e)
+            return [self._step_result(position, step['action'], False, error=error, batched=True)
+                    for position, step, _ in group]
+        results = []
+        for (position, step, _), outcome in zip(group, outcomes):
+            if outcome is None:
+                results.append(self._step_result(position, step['action'], False,
+                                                 error='Skipped after previous error', skipped=True))
+                continue
+            results.append(self._step_result(
+                position, step['action'], outcome['success'], error=outcome.get('error'),
+                value=outcome.get('value'), elapsed_ms=outcome.get('elapsed_ms'), batched=True
+            ))
+        return results
+
+    def _resolve_step_selector(self, step):
+        page_id = step.get('page_id')
+        alias = step.get('selector_alias')
+        if not page_id or not alias:
+            return None, 'Missing page_id or selector_alias'
         try:
-            screenshot_data = self.driver.get_screenshot_as_png()
+            return self._resolve_selector(page_id, alias)
+        except NotFound:
+            return None, 'Page not found'
+
+    @staticmethod
+    def _step_result(position, action, success, error=None, value=None, elapsed_ms=None, batched=False, skipped=False):
+        result = {'index': position, 'action': action, 'success': success}
+        if action == 'get-value' and success:
+            result['value'] = value
+        if error:
+            result['error'] = error
+        if elapsed_ms is not None:
+            result['elapsed_ms'] = round(elapsed_ms, 2)
+        if batched:
+            result['batched'] = True
+        if skipped:
+            result['skipped'] = True
+        return result
+
+    def take_screenshot(self, image_format='png', quality=None, scale=1.0, clip=None, page_id=None, alias=None):
+        # clip is {x, y, width, height} in CSS pixels of the viewport, page_id
+        # and alias capture a single element instead
+        locator = None
+        if alias:
+            locator, error = self._resolve_selector(page_id, alias)
+            if error:
+                return None, error
+        try:
+            if hasattr(self.driver, 'execute_cdp_cmd'):
+                return self._capture_cdp(image_format, quality, scale, clip, locator)
+            if _remote_cdp(self.driver):
+                try:
+                    return self._capture_cdp(image_format, quality, scale, clip, locator)
+                except WebDriverException as e:
+                    if 'unknown command' not in str(e).lower():
+                        raise
+                    _REMOTE_CDP_REFUSED.add(self.driver)
+            return self._capture_webdriver(image_format, quality, scale, clip, locator)
+        except NoSuchElementException:
+            return None, 'Element not found'
         except Exception as e:
             return None, f'Failed to take screenshot: {str(e)}'
-        return screenshot_data, None
+
+    def _capture_cdp(self, image_format, quality, scale, clip, locator):
+        # Chrome encodes, scales and clips the capture itself
+        params = {'format': image_format}
+        if quality is not None and image_format != 'png':
+            params['quality'] = quality
+        if locator or clip or scale != 1:
+            box = selector_engine.call(self.driver, 'pageRect', locator, clip)
+            if box is None:
+                return None, 'Element not found'
+            params['clip'] = dict(box, scale=scale)
+            params['captureBeyondViewport'] = locator is not None
+        result = _execute_cdp(self.driver, 'Page.captureScreenshot', params)
+        return base64.b64decode(result['data']), None
+
+    def _capture_webdriver(self, image_format, quality, scale, clip, locator):
+        if locator:
+            png = self.driver.find_element(*to_by(locator)).screenshot_as_png
+        else:
+            png = self.driver.get_screenshot_as_png()
+        if image_format == 'png' and scale == 1 and not clip:
+            return png, None
+        try:
+            from PIL import Image
+        except ImportError:
+            return None, PILLOW_REQUIRED
+        image = Image.open(io.BytesIO(png))
+        if clip:
+            # The PNG is in device pixels
+            ratio = self.driver.execute_script('return window.devicePixelRatio;') or 1
+            box = (clip['x'], clip['y'], clip['x'] + clip['width'], clip['y'] + clip['height'])
+            image = image.crop(tuple(round(value * ratio) for value in box))
+        if scale != 1:
+            image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+        if image_format == 'jpeg':
+            image = image.convert('RGB')
+        options = {'quality': quality} if quality is not None and image_format != 'png' else {}
+        output = io.BytesIO()
+        image.save(output, format=image_format.upper(), **options)
+        return output.getvalue(), None
+
+    def view_state(self):
+        # Changes whenever the DOM, the scroll position or the viewport changes
+        try:
+            return selector_engine.call(self.driver, 'viewState')
+        except JavascriptException:
+            return None
 
     def get_dom(self):
         try:
@@ -77,65 +382,41 @@ class BrowserActions:
         except Exception as e:
             return None, f'Failed to get DOM: {str(e)}'
         return dom, None
+
+    def get_dom_snapshot(self, known=()):
+        # {'tag': revision, 'html': markup}, without the markup when the
+        # revision is one of known. None when the document cannot be read
+        # through the selector engine.
+        try:
+            return selector_engine.call(self.driver, 'domSnapshot', list(known))
+        except JavascriptException:
+            return None
+
+    def get_cleaned_dom(self):
+        # Pruned on a copy inside the browser, only the reduced markup crosses the wire
+        try:
+            dom = selector_engine.call(self.driver, 'cleanedDom')
+        except Exception as e:
+            return None, f'Failed to clean DOM: {str(e)}'
+        return dom, None
     
     def get_current_pages(self, pages):
-        # Exclude pages with no identifying selectors
-        filtered_pages = [page for page in pages if page.get('identifying_selectors')]
-
-        # Collect all unique xpaths from all identifying selectors of all filtered pages
-        all_xpaths = set()
-        for page in filtered_pages:
-            for selector in page.get('identifying_selectors', []):
-                xpath = selector.get('xpath')
-                if xpath:
-                    all_xpaths.add(xpath)
-
-        # Check all selectors at once
-        selector_results = self.check_selectors(list(all_xpaths))
-
-        matched_pages = []
-        for page in filtered_pages:
-            all_match = True
-            for selector in page.get('identifying_selectors', []):
-                xpath = selector.get('xpath')
-                if not xpath:
-                    all_match = False
-                    break
-                result = selector_results.get(xpath, {})
-                exists = result.get('existing', False)
-                visible = result.get('visible', False)
-                required_visible = selector.get('visible', None)
-                # Normalize required_visible to boolean if it's a string
-                if isinstance(required_visible, str):
-                    if required_visible.lower() == 'true':
-                        required_visible = True
-                    elif required_visible.lower() == 'false':
-                        required_visible = False
-                # Must exist
-                if not exists:
-                    all_match = False
-                    break
-                # If visible is set, must match
-                if required_visible is not None and visible != required_visible:
-                    all_match = False
-                    break
-            if all_match:
-                matched_pages.append(page)
-        return matched_pages
-
-    def _find_selector(self, page, alias):
-        selectors = page.identifying_selectors + (page.interactive_selectors or [])
-        for selector in selectors:
-            if selector.get('alias') == alias:
-                return selector.get('xpath')
-        return None
+        return self.match_pages(PageIndex(pages))
+
+    def match_pages(self, index):
+        # The plan is cached in the document, it is only sent when the page does not know it yet
+        matched = selector_engine.call(self.driver, 'matchPages', index.key, None)
+        if isinstance(matched, dict) and matched.get('__planMissing'):
+            matched = selector_engine.call(self.driver, 'matchPages', index.key, index.plan())
+        return [index.pages[i] for i in matched]
 
     def check_selectors(self, selectors):
-        js_code = self._generate_selector_check_js(selectors)
-        return self.driver.execute_script(js_code)
+        return selector_engine.call(self.driver, 'check', list(selectors))
 
     @staticmethod
     def _generate_selector_check_js(selectors):
+        # Legacy one-off script with the XPaths inlined, superseded by the
+        # persistent selector engine and kept for benchmarks/selector_engine.py
         js = '''
 function isElementVisible(el) {
     if (!el) return false; 
@@ -176,3 +457,34 @@ var result = {};
         return js
 
     # Add more methods as needed for selector checks, etc.
+
+
+def parse_timeout(value):
+    # Seconds as a number or, from some clients, a numeric string
+    if isinstance(value, bool):
+        raise ValueError(TIMEOUT_ERROR)
+    try:
+        timeout = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(TIMEOUT_ERROR)
+    if not 0 < timeout < math.inf:
+        raise ValueError(TIMEOUT_ERROR)
+    return timeout
+
+
+def _step_error(e):
+    # First line of the message, WebDriver appends stack traces and capabilities
+    message = getattr(e, 'msg', None) or str(e) or type(e).__name__
+    return message.splitlines()[0]
+
+
+def _remote_cdp(driver):
+    # Remote Chrome sessions reach DevTools through the goog/cdp/execute endpoint
+    return isinstance(getattr(driver, 'command_executor', None), ChromiumRemoteConnection) \
+        and driver not in _REMOTE_CDP_REFUSED
+
+
+def _execute_cdp(driver, cmd, params):
+    if hasattr(driver, 'execute_cdp_cmd'):
+        return driver.execute_cdp_cmd(cmd, params)
+    return driver.execute('executeCdpCommand', {'cmd': cmd, 'params': params})['value']
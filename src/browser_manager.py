@@ -1,14 +1,315 @@
+import logging
 import os
+import threading
+import time
 import uuid
+from collections import OrderedDict
 from selenium import webdriver
+from selenium.common.exceptions import InvalidSessionIdException
 from selenium.webdriver.chrome.service import Service as ChromeService
+from src.driver_pool import DriverPool
+from src.element_cache import ElementCache
+from src.dom_snapshots import DomSnapshots
+from src.hub_scheduler import HubScheduler, NoCapacityError
+from src.session_executor import SessionExecutor
+from src.session_registry import MemorySessionRegistry, create_registry, current_owner
+
+logger = logging.getLogger(__name__)
+
+class SessionNotFoundError(Exception):
+    pass
+
+class AttachedRemote(webdriver.Remote):
+    # Remote driver bound to an already running WebDriver session instead of starting a new one
+    def __init__(self, executor_url, remote_session_id):
+        self._attach_session_id = remote_session_id
+        super().__init__(command_executor=executor_url, options=webdriver.ChromeOptions())
+
+    def start_session(self, capabilities):
+        self.session_id = self._attach_session_id
+        self.caps = {}
 
 class BrowserManager:
-    def __init__(self):
-        self.sessions = {}
+    def __init__(self, driver_factory=None, session_ttl=0, max_sessions=0, reaper_interval=30, queue_size=16,
+                 endpoints=None, connect=None, registry=None, attach=None):
+        # Ordered by last use, least recently used first
+        self.sessions = OrderedDict()
+        self.last_used = {}
+        self.executors = {}
+        self.element_caches = {}
+        self.dom_snapshots = {}
+        self.queue_size = queue_size
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self.reaper_interval = reaper_interval
+        self.driver_factory = driver_factory or self._start_driver
+        self.pool = DriverPool(self.driver_factory, dispose=self._quit)
+        # Remote endpoints; built lazily from SELENIUM_HUB_URLS / SELENIUM_HUB_URL when not given
+        self._connect = connect or self._connect_remote
+        self.scheduler = HubScheduler(endpoints, self._connect) if endpoints else None
+        # Registry shared by the worker processes, lets any worker reattach to a session
+        self.registry = registry or MemorySessionRegistry()
+        self.attach = attach or AttachedRemote
+        self.registry_touch_interval = 10
+        self._registry_touched = {}
+        self._lock = threading.RLock()
+        self._reaper = None
+        self._reaper_stop = threading.Event()
+
+    def init_app(self, app):
+        self.pool.resize(app.config.get('BROWSER_POOL_MIN', 0), app.config.get('BROWSER_POOL_MAX', 0))
+        self.pool.idle_timeout = app.config.get('BROWSER_POOL_IDLE_TIMEOUT', self.pool.idle_timeout)
+        self.session_ttl = app.config.get('BROWSER_SESSION_TTL', self.session_ttl)
+        self.max_sessions = app.config.get('BROWSER_MAX_SESSIONS', self.max_sessions)
+        self.reaper_interval = app.config.get('BROWSER_REAPER_INTERVAL', self.reaper_interval)
+        self.queue_size = app.config.get('BROWSER_SESSION_QUEUE_SIZE', self.queue_size)
+        self.registry = create_registry(app)
+        self.pool.start()
 
     def create_session(self, timeout=None):
         session_id = str(uuid.uuid4())
+        # Fail before starting a browser when every session is busy
+        with self._lock:
+            self._sessions_to_evict()
+        driver = self.pool.acquire()
+
+        # Set the command executor timeout for both local and remote sessions.
+        # A value of None should make it wait indefinitely.
+        if timeout is not None:
+            driver.command_executor.set_timeout(timeout)
+
+        try:
+            with self._lock:
+                evicted = [(old_session_id, self._pop_session(old_session_id))
+                           for old_session_id in self._sessions_to_evict()]
+                self.sessions[session_id] = driver
+                self.last_used[session_id] = time.monotonic()
+                self.executors[session_id] = SessionExecutor(session_id, self.queue_size)
+                self.element_caches[session_id] = ElementCache()
+                self.dom_snapshots[session_id] = DomSnapshots()
+        except NoCapacityError:
+            # Sessions became busy while the browser started
+            self._quit(driver)
+            raise
+        self.registry.register(session_id, driver.session_id, self._executor_url(driver), current_owner())
+        self._registry_touched[session_id] = time.time()
+        for old_session_id, old_driver in evicted:
+            logger.info('Evicting least recently used browser session %s', old_session_id)
+            self._quit(old_driver)
+            self.registry.unregister(old_session_id)
+        self._start_reaper()
+        return session_id
+
+    def _sessions_to_evict(self):
+        # Least recently used sessions to close so one more fits, skipping busy
+        # ones like the reaper does. Called with the lock held
+        if not self.max_sessions:
+            return []
+        excess = len(self.sessions) - self.max_sessions + 1
+        if excess <= 0:
+            return []
+        idle = [session_id for session_id in self.sessions
+                if not (self.executors.get(session_id) and self.executors[session_id].busy)]
+        if len(idle) < excess:
+            raise NoCapacityError('All browser sessions are busy, try again later')
+        return idle[:excess]
+
+    def get_session(self, session_id):
+        driver = self._resolve(session_id)
+        if driver is not None:
+            self.touch(session_id)
+        return driver
+
+    def execute(self, session_id, fn, *args, **kwargs):
+        # Run fn(driver, ...) on the session's own command thread and wait for the result
+        future = self.submit(session_id, fn, *args, **kwargs)
+        self.touch(session_id)
+        try:
+            return future.result()
+        finally:
+            self.touch(session_id)
+
+    def submit(self, session_id, fn, *args, **kwargs):
+        # Queue fn(driver, ...) on the session's own command thread and return its future
+        driver = self._resolve(session_id)
+        with self._lock:
+            executor = self.executors.get(session_id)
+        if driver is None or executor is None:
+            raise SessionNotFoundError(session_id)
+        return executor.submit(self._run_command, session_id, driver, fn, *args, **kwargs)
+
+    def is_busy(self, session_id):
+        # True while commands of the session are running or queued
+        with self._lock:
+            executor = self.executors.get(session_id)
+        return executor is not None and executor.busy
+
+    def touch(self, session_id):
+        with self._lock:
+            if session_id not in self.sessions:
+                return
+            self.sessions.move_to_end(session_id)
+            self.last_used[session_id] = time.monotonic()
+            now = time.time()
+            if now - self._registry_touched.get(session_id, 0) < self.registry_touch_interval:
+                return
+            self._registry_touched[session_id] = now
+        self.registry.touch(session_id)
+
+    def close_session(self, session_id):
+        self._resolve(session_id)
+        with self._lock:
+            driver = self._pop_session(session_id)
+        if driver:
+            self._quit(driver)
+        self.registry.unregister(session_id)
+
+    def reap_idle_sessions(self):
+        if not self.session_ttl:
+            return []
+        deadline = time.monotonic() - self.session_ttl
+        candidates = []
+        with self._lock:
+            for session_id in list(self.sessions):
+                if self.last_used.get(session_id, 0) > deadline:
+                    # Sessions are ordered by last use, so the rest are fresh
+                    break
+                executor = self.executors.get(session_id)
+                if executor and executor.busy:
+                    continue
+                candidates.append(session_id)
+        expired = []
+        for session_id in candidates:
+            idle_for = self.session_ttl
+            if self.registry.shared:
+                # Another worker may have used the session in the meantime
+                entry = self.registry.lookup(session_id)
+                if entry:
+                    idle_for = time.time() - entry['last_used']
+            with self._lock:
+                if session_id not in self.sessions:
+                    continue
+                if idle_for < self.session_ttl:
+                    self.last_used[session_id] = time.monotonic() - idle_for
+                    continue
+                expired.append((session_id, self._pop_session(session_id)))
+        for session_id, driver in expired:
+            logger.info('Reaping idle browser session %s', session_id)
+            self._quit(driver)
+            self.registry.unregister(session_id)
+        return [session_id for session_id, _ in expired]
+
+    def get_element_cache(self, session_id):
+        with self._lock:
+            return self.element_caches.get(session_id)
+
+    def get_dom_snapshots(self, session_id):
+        with self._lock:
+            return self.dom_snapshots.get(session_id)
+
+    def invalidate_page(self, page_id):
+        # A page definition changed, drop its resolved selectors in every session
+        with self._lock:
+            caches = list(self.element_caches.values())
+        for cache in caches:
+            cache.invalidate_page(page_id)
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def endpoint_stats(self):
+        if os.environ.get('SELENIUM_MODE', 'remote') == 'local' and self.scheduler is None:
+            return []
+        return self.get_scheduler().utilization()
+
+    def get_scheduler(self):
+        with self._lock:
+            if self.scheduler is None:
+                spec = os.environ.get('SELENIUM_HUB_URLS') or \
+                    os.environ.get('SELENIUM_HUB_URL', 'http://selenium:4444/wd/hub')
+                retry_after = int(os.environ.get('SELENIUM_HUB_RETRY_AFTER', 30))
+                self.scheduler = HubScheduler(HubScheduler.parse(spec), self._connect, retry_after)
+            return self.scheduler
+
+    def _run_command(self, session_id, driver, fn, *args, **kwargs):
+        try:
+            return fn(driver, *args, **kwargs)
+        except InvalidSessionIdException:
+            # Closed by another worker or gone on the hub, forget our handle to it
+            with self._lock:
+                self._pop_session(session_id)
+            if self.scheduler:
+                self.scheduler.release(driver)
+            self.registry.unregister(session_id)
+            raise SessionNotFoundError(session_id)
+
+    def _resolve(self, session_id):
+        # Local driver for the session, attaching to it when another worker created it
+        with self._lock:
+            driver = self.sessions.get(session_id)
+        if driver is not None:
+            return driver
+        entry = self.registry.lookup(session_id)
+        if entry is None:
+            return None
+        try:
+            driver = self.attach(entry['executor_url'], entry['remote_session_id'])
+        except Exception:
+            logger.exception('Failed to attach to browser session %s', session_id)
+            return None
+        with self._lock:
+            if session_id in self.sessions:
+                return self.sessions[session_id]
+            self.sessions[session_id] = driver
+            self.last_used[session_id] = time.monotonic()
+            self.executors[session_id] = SessionExecutor(session_id, self.queue_size)
+            self.element_caches[session_id] = ElementCache()
+            self.dom_snapshots[session_id] = DomSnapshots()
+        self._start_reaper()
+        return driver
+
+    @staticmethod
+    def _executor_url(driver):
+        executor = driver.command_executor
+        url = getattr(executor, '_url', None)
+        if url is None and hasattr(executor, 'client_config'):
+            url = executor.client_config.remote_server_addr
+        return url
+
+    def _pop_session(self, session_id):
+        self.last_used.pop(session_id, None)
+        self._registry_touched.pop(session_id, None)
+        self.element_caches.pop(session_id, None)
+        self.dom_snapshots.pop(session_id, None)
+        executor = self.executors.pop(session_id, None)
+        if executor:
+            executor.shutdown()
+        return self.sessions.pop(session_id, None)
+
+    def _start_reaper(self):
+        with self._lock:
+            if not self.session_ttl or (self._reaper and self._reaper.is_alive()):
+                return
+            self._reaper = threading.Thread(target=self._run_reaper, name='browser-session-reaper', daemon=True)
+            self._reaper.start()
+
+    def _run_reaper(self):
+        while not self._reaper_stop.wait(self.reaper_interval):
+            try:
+                self.reap_idle_sessions()
+            except Exception:
+                logger.exception('Browser session reaper failed')
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            logger.exception('Failed to quit browser session')
+        finally:
+            if self.scheduler:
+                self.scheduler.release(driver)
+
+    def _start_driver(self):
         options = webdriver.ChromeOptions()
 
         selenium_mode = os.environ.get('SELENIUM_MODE', 'remote')
@@ -33,42 +334,30 @@ class BrowserManager:
                 "intl.accept_languages": "en,en_US"
             })
 
-            driver = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
-        else:
-            # Remote execution for Docker setup
-            options.add_argument('--headless=new')
-            options.add_argument('--no-sandbox')
-            options.add_argument('--disable-dev-shm-usage')
-            options.add_argument('--disable-gpu')
-            options.add_argument("--lang=en")
-            options.add_argument("--accept-lang=en")
-            # Suppress ChromeDriver and GCM logs
-            options.add_argument('--log-level=3')
-            options.add_experimental_option('excludeSwitches', ['enable-logging'])
-            options.add_experimental_option("prefs", {
-                "intl.accept_languages": "en,en_US"
-            })
-
-            selenium_hub_url = os.environ.get('SELENIUM_HUB_URL', 'http://selenium:4444/wd/hub')
-            driver = webdriver.Remote(
-                command_executor=selenium_hub_url,
-                options=options
-            )
+            return webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
 
-        # Set the command executor timeout for both local and remote sessions.
-        # A value of None should make it wait indefinitely.
-        if timeout is not None:
-            driver.command_executor.set_timeout(timeout)
+        # Remote execution for Docker setup, spread over the configured hubs
+        return self.get_scheduler().start_driver()
 
-        self.sessions[session_id] = driver
-        return session_id
-
-    def get_session(self, session_id):
-        return self.sessions.get(session_id)
+    @staticmethod
+    def _connect_remote(selenium_hub_url):
+        options = webdriver.ChromeOptions()
+        options.add_argument('--headless=new')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-gpu')
+        options.add_argument("--lang=en")
+        options.add_argument("--accept-lang=en")
+        # Suppress ChromeDriver and GCM logs
+        options.add_argument('--log-level=3')
+        options.add_experimental_option('excludeSwitches', ['enable-logging'])
+        options.add_experimental_option("prefs", {
+            "intl.accept_languages": "en,en_US"
+        })
 
-    def close_session(self, session_id):
-        driver = self.sessions.pop(session_id, None)
-        if driver:
-            driver.quit()
+        return webdriver.Remote(
+            command_executor=selenium_hub_url,
+            options=options
+        )
 
-browser_manager = BrowserManager()
\ No newline at end of file
+browser_manager = BrowserManager()
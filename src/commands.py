@@ -0,0 +1,25 @@
+import click
+from flask.cli import AppGroup
+from src import db
+from src.models import Page, CatalogChange
+
+selectors_cli = AppGroup('selectors', help='Manage page selectors.')
+
+
+@selectors_cli.command('backfill')
+def backfill_selectors():
+    """Move selectors from the legacy JSON columns of pages into the selector table."""
+    moved = 0
+    pages = Page.query.filter(db.or_(Page.legacy_identifying_selectors.isnot(None),
+                                     Page.legacy_interactive_selectors.isnot(None))).all()
+    for page in pages:
+        # Pages edited since the upgrade already have rows, those win. Columns
+        # cleared by earlier runs of a version storing JSON null have nothing to move
+        if page.has_legacy_selectors:
+            page.move_legacy_selectors()
+            CatalogChange.record('page', page.id, 'updated')
+            moved += 1
+        page.legacy_identifying_selectors = None
+        page.legacy_interactive_selectors = None
+    db.session.commit()
+    click.echo(f'Moved the selectors of {moved} page(s)')
@@ -7,4 +7,20 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'app.db')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Warm pool of pre-started browsers; a minimum of 0 disables the pool
+    BROWSER_POOL_MIN = int(os.environ.get('BROWSER_POOL_MIN', 0))
+    BROWSER_POOL_MAX = int(os.environ.get('BROWSER_POOL_MAX', BROWSER_POOL_MIN))
+    BROWSER_POOL_IDLE_TIMEOUT = int(os.environ.get('BROWSER_POOL_IDLE_TIMEOUT', 300))
+    # Sessions unused for this many seconds are closed by the reaper (0 disables it)
+    BROWSER_SESSION_TTL = int(os.environ.get('BROWSER_SESSION_TTL', 1800))
+    # Upper bound of open sessions, the least recently used one is evicted (0 means unlimited)
+    BROWSER_MAX_SESSIONS = int(os.environ.get('BROWSER_MAX_SESSIONS', 0))
+    BROWSER_REAPER_INTERVAL = int(os.environ.get('BROWSER_REAPER_INTERVAL', 30))
+    # Commands waiting per session before further requests are rejected with 429
+    BROWSER_SESSION_QUEUE_SIZE = int(os.environ.get('BROWSER_SESSION_QUEUE_SIZE', 16))
+    # Where open sessions are registered: 'memory' (single worker), 'database' or 'file'.
+    # A shared registry lets every server worker reattach to any session.
+    SESSION_REGISTRY = os.environ.get('SESSION_REGISTRY', 'memory')
+    SESSION_REGISTRY_FILE = os.environ.get('SESSION_REGISTRY_FILE') or \
+        os.path.join(os.path.abspath(os.path.dirname(__file__)), 'sessions.json')
@@ -0,0 +1,116 @@
+from html.parser import HTMLParser
+
+# Same pruning as the in-page cleanedDom() of the selector engine: these tags
+# are dropped with their content, svg elements are kept but emptied
+REMOVED_TAGS = {'script', 'img', 'style', 'link'}
+EMPTIED_TAGS = {'svg'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+
+class _Cleaner(HTMLParser):
+    """Rewrites markup event by event without building a tree; the output
+    collects in self.out and is drained by iter_clean_dom()."""
+
+    def __init__(self, pretty):
+        super().__init__(convert_charrefs=False)
+        self.pretty = pretty
+        self.out = []
+        self._text = []
+        self._depth = 0
+        self._skipping = None  # removed or emptied tag whose content is dropped
+        self._nested = 0  # same tags opened inside the skipped one
+
+    def _emit(self, markup):
+        if self.pretty:
+            self.out.append(' ' * self._depth + markup + '\n')
+        else:
+            self.out.append(markup)
+
+    def _flush_text(self):
+        if not self._text:
+            return
+        text = ''.join(self._text)
+        self._text.clear()
+        if not self.pretty:
+            self.out.append(text)
+        elif text.strip():
+            self._emit(text.strip())
+
+    def handle_starttag(self, tag, attrs):
+        if self._skipping:
+            if tag == self._skipping:
+                self._nested += 1
+            return
+        if tag in REMOVED_TAGS:
+            if tag not in VOID_TAGS:
+                self._skipping, self._nested = tag, 0
+            return
+        self._flush_text()
+        self._emit(self.get_starttag_text())
+        if tag in EMPTIED_TAGS:
+            self._skipping, self._nested = tag, 0
+        if tag not in VOID_TAGS:
+            self._depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if self._skipping or tag in REMOVED_TAGS:
+            return
+        self._flush_text()
+        self._emit(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self._skipping:
+            if tag != self._skipping:
+                return
+            if self._nested:
+                self._nested -= 1
+                return
+            self._skipping = None
+            if tag in REMOVED_TAGS:
+                return
+        if tag in VOID_TAGS or tag in REMOVED_TAGS:
+            return
+        self._flush_text()
+        self._depth = max(self._depth - 1, 0)
+        self._emit(f'</{tag}>')
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self._text.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(f'&{name};')
+
+    def handle_charref(self, name):
+        self.handle_data(f'&#{name};')
+
+    def handle_comment(self, data):
+        if not self._skipping:
+            self._flush_text()
+            self._emit(f'<!--{data}-->')
+
+    def handle_decl(self, decl):
+        self._flush_text()
+        self._emit(f'<!{decl}>')
+
+    def close(self):
+        super().close()
+        self._flush_text()
+
+
+def iter_clean_dom(html, pretty=False, chunk_size=64 * 1024):
+    """Yield the cleaned markup of html piece by piece, optionally
+    pretty-printed with one tag or text per line."""
+    cleaner = _Cleaner(pretty)
+    for start in range(0, len(html), chunk_size):
+        cleaner.feed(html[start:start + chunk_size])
+        if cleaner.out:
+            yield ''.join(cleaner.out)
+            cleaner.out.clear()
+    cleaner.close()
+    if cleaner.out:
+        yield ''.join(cleaner.out)
+
+
+def clean_dom(html, pretty=False):
+    return ''.join(iter_clean_dom(html, pretty))
@@ -0,0 +1,73 @@
+import difflib
+import re
+import threading
+from collections import OrderedDict
+
+# Markup is diffed in tokens ending at a tag boundary, single line SPA markup
+# would otherwise differ in its one and only line
+_TOKEN = re.compile(r'[^>]*>|[^>]+$')
+
+
+def _tokens(html):
+    return _TOKEN.findall(html)
+
+
+# Tokens per side left to match once the common prefix and suffix are cut off.
+# SequenceMatcher is quadratic on repetitive markup, bigger changes are sent whole
+MAX_DIFF_TOKENS = 1000
+
+
+def diff(old, new):
+    """Edits turning old into new as [start, end, text] triples with
+    character offsets into old, in ascending order. Applying them from the
+    last to the first keeps the offsets valid. None when the changed part is
+    too large to diff cheaply."""
+    old_tokens = _tokens(old)
+    new_tokens = _tokens(new)
+    prefix = 0
+    limit = min(len(old_tokens), len(new_tokens))
+    while prefix < limit and old_tokens[prefix] == new_tokens[prefix]:
+        prefix += 1
+    suffix = 0
+    limit -= prefix
+    while suffix < limit and old_tokens[-1 - suffix] == new_tokens[-1 - suffix]:
+        suffix += 1
+    old_middle = old_tokens[prefix:len(old_tokens) - suffix]
+    new_middle = new_tokens[prefix:len(new_tokens) - suffix]
+    if len(old_middle) > MAX_DIFF_TOKENS or len(new_middle) > MAX_DIFF_TOKENS:
+        return None
+    offsets = [sum(len(token) for token in old_tokens[:prefix])]
+    for token in old_middle:
+        offsets.append(offsets[-1] + len(token))
+    edits = []
+    matcher = difflib.SequenceMatcher(None, old_middle, new_middle, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op != 'equal':
+            edits.append([offsets[i1], offsets[i2], ''.join(new_middle[j1:j2])])
+    return edits
+
+
+def apply_diff(old, edits):
+    for start, end, text in reversed(edits):
+        old = old[:start] + text + old[end:]
+    return old
+
+
+class DomSnapshots:
+    """The last few DOM snapshots served to a session's clients, by revision tag."""
+
+    def __init__(self, limit=4):
+        self.limit = limit
+        self._snapshots = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, tag, html):
+        with self._lock:
+            self._snapshots[tag] = html
+            self._snapshots.move_to_end(tag)
+            while len(self._snapshots) > self.limit:
+                self._snapshots.popitem(last=False)
+
+    def get(self, tag):
+        with self._lock:
+            return self._snapshots.get(tag)
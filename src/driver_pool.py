@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPool:
+    """Keeps a number of started WebDriver instances idle so new sessions do
+    not have to wait for a browser to boot.
+
+    ``min_idle`` drivers are always kept warm. Every miss raises the refill
+    target by one (up to ``max_idle``) so bursts are absorbed by the next
+    wave; drivers above ``min_idle`` that stay unused for ``idle_timeout``
+    seconds are quit again.
+    """
+
+    def __init__(self, factory, min_idle=0, max_idle=0, idle_timeout=300, refill_interval=5, dispose=None):
+        self.factory = factory
+        self.dispose = dispose
+        self.min_idle = 0
+        self.max_idle = 0
+        self.idle_timeout = idle_timeout
+        self.refill_interval = refill_interval
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._idle = deque()  # (driver, idle_since)
+        self._starting = 0
+        self._target = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self.resize(min_idle, max_idle)
+
+    @property
+    def enabled(self):
+        return self.max_idle > 0
+
+    def resize(self, min_idle, max_idle=None):
+        min_idle = max(0, int(min_idle or 0))
+        max_idle = max(min_idle, int(max_idle or 0))
+        with self._lock:
+            self.min_idle = min_idle
+            self.max_idle = max_idle
+            self._target = min(max(self._target, min_idle), max_idle)
+        self._wakeup.set()
+
+    def start(self):
+        with self._lock:
+            if not self.enabled or (self._thread and self._thread.is_alive()):
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='driver-pool-refill', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            drivers = [driver for driver, _ in self._idle]
+            self._idle.clear()
+        self._wakeup.set()
+        for driver in drivers:
+            self._quit(driver)
+
+    def acquire(self):
+        """Return a healthy warm driver, or start a new one on a miss."""
+        if not self.enabled:
+            return self.factory()
+        self.start()
+        while True:
+            with self._lock:
+                driver = self._idle.popleft()[0] if self._idle else None
+            if driver is None:
+                break
+            if self._is_healthy(driver):
+                with self._lock:
+                    self.hits += 1
+                self._wakeup.set()
+                return driver
+            logger.warning('Discarding unhealthy pooled driver')
+            self._quit(driver)
+        with self._lock:
+            self.misses += 1
+            self._target = min(self._target + 1, self.max_idle)
+        self._wakeup.set()
+        return self.factory()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'min_idle': self.min_idle,
+                'max_idle': self.max_idle,
+                'target': self._target,
+                'idle': len(self._idle),
+                'starting': self._starting,
+                'hits': self.hits,
+                'misses': self.misses,
+                'failures': self.failures,
+            }
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.refill_interval)
+            self._wakeup.clear()
+            if self._stopped:
+                return
+            self._trim()
+            while self._claim_start_slot():
+                try:
+                    driver = self.factory()
+                except Exception:
+                    logger.exception('Failed to start pooled driver')
+                    with self._lock:
+                        self._starting -= 1
+                        self.failures += 1
+                    break
+                with self._lock:
+                    self._starting -= 1
+                    if self._stopped:
+                        driver_to_quit = driver
+                    else:
+                        self._idle.append((driver, time.monotonic()))
+                        driver_to_quit = None
+                if driver_to_quit is not None:
+                    self._quit(driver_to_quit)
+                    return
+
+    def _claim_start_slot(self):
+        with self._lock:
+            if self._stopped or len(self._idle) + self._starting >= self._target:
+                return False
+            self._starting += 1
+            return True
+
+    def _trim(self):
+        # Let the pool shrink back towards min_idle once the burst is over
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            while len(self._idle) > self.min_idle and now - self._idle[0][1] > self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+                self._target = max(self._target - 1, self.min_idle)
+        for driver in expired:
+            self._quit(driver)
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _quit(self, driver):
+        if self.dispose:
+            self.dispose(driver)
+            return
+        try:
+            driver.quit()
+        except Exception:
+            logger.exception('Failed to quit pooled driver')
@@ -0,0 +1,62 @@
+import threading
+
+
+class ElementCache:
+    """Per session cache of resolved locators and WebElement references,
+    keyed on (page_id, alias).
+
+    Element references are dropped on navigation and whenever WebDriver
+    reports them stale; the resolved locators are kept until the page
+    definition changes.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._entries = {}  # (page_id, alias) -> {'locator': ..., 'element': ...}
+        self._lock = threading.Lock()
+
+    def get(self, page_id, alias):
+        with self._lock:
+            entry = self._entries.get((str(page_id), alias))
+            return dict(entry) if entry else None
+
+    def put(self, page_id, alias, locator, element=None):
+        with self._lock:
+            self._entries[(str(page_id), alias)] = {'locator': locator, 'element': element}
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def forget_element(self, page_id, alias):
+        with self._lock:
+            entry = self._entries.get((str(page_id), alias))
+            if entry and entry['element'] is not None:
+                entry['element'] = None
+                self.stale += 1
+
+    def clear_elements(self):
+        # The document changed, every element reference is gone
+        with self._lock:
+            for entry in self._entries.values():
+                entry['element'] = None
+
+    def invalidate_page(self, page_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == str(page_id)]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'elements': sum(1 for entry in self._entries.values() if entry['element'] is not None),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale
+            }
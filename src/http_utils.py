@@ -0,0 +1,116 @@
+import gzip
+import hashlib
+import json
+import zlib
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only without it
+    brotli = None
+
+# Smaller bodies are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def accepted_encoding():
+    # Best content coding the client accepts, brotli only when the package is installed
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def content_etag(body):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha1(body).hexdigest()
+
+
+def not_modified(etag):
+    # If-None-Match uses the weak comparison, compressed responses carry weak tags
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def _encode(chunks):
+    for chunk in chunks:
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def _buffered(chunks, size=STREAM_CHUNK_SIZE):
+    # Joins small pieces (e.g. of JSONEncoder.iterencode) into chunks of about size bytes
+    buffer = []
+    length = 0
+    for chunk in _encode(chunks):
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _compress_stream(chunks, encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip container
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def send_body(body, mimetype, etag=None, status=200):
+    """Response for body, a str or bytes or an iterable of them, that answers
+    If-None-Match with 304 and compresses according to Accept-Encoding.
+    Iterables are streamed chunk by chunk without building the whole body."""
+    if not_modified(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    encoding = accepted_encoding()
+    whole = isinstance(body, (str, bytes))
+    if whole:
+        body = body.encode('utf-8') if isinstance(body, str) else body
+        if len(body) < MIN_COMPRESS_SIZE:
+            encoding = None
+    else:
+        body = _buffered(body)
+    if encoding is None:
+        response = Response(body, mimetype=mimetype, status=status)
+    else:
+        response = Response(_compress(body, encoding) if whole else _compress_stream(body, encoding),
+                            mimetype=mimetype, status=status)
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if etag is not None:
+        # The representation differs per coding, so only the weak tag is shared
+        response.set_etag(etag, weak=encoding is not None)
+    return response
+
+
+def send_json(data, etag=None, status=200, stream=False):
+    """JSON counterpart of send_body using the app's JSON settings. The ETag
+    defaults to a hash of the content; stream encodes the data piece by piece
+    instead and then sends no ETag."""
+    if stream:
+        provider = current_app.json
+        encoder = json.JSONEncoder(sort_keys=provider.sort_keys, ensure_ascii=provider.ensure_ascii,
+                                   default=provider.default, separators=(',', ':'))
+        return send_body(encoder.iterencode(data), 'application/json', status=status)
+    body = current_app.json.dumps(data, separators=(',', ':'))
+    return send_body(body, 'application/json', etag or content_etag(body), status)
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class NoCapacityError(Exception):
+    pass
+
+
+class HubEndpoint:
+    def __init__(self, url, capacity=0):
+        self.url = url
+        # 0 means the endpoint queues sessions itself and is never considered full
+        self.capacity = capacity
+        self.active = 0
+        self.healthy = True
+        self.failures = 0
+        self.last_error = None
+        self.retry_at = 0
+
+    @property
+    def load(self):
+        return self.active / self.capacity if self.capacity else 0
+
+    def has_free_slot(self):
+        return not self.capacity or self.active < self.capacity
+
+    def to_dict(self):
+        return {
+            'url': self.url,
+            'capacity': self.capacity or None,
+            'active': self.active,
+            'utilization': round(self.load, 3) if self.capacity else None,
+            'healthy': self.healthy,
+            'failures': self.failures,
+            'last_error': self.last_error
+        }
+
+
+class HubScheduler:
+    """Places new WebDriver sessions on the least loaded healthy endpoint.
+
+    Endpoints that fail to start a session are skipped for ``retry_after``
+    seconds and then tried again.
+    """
+
+    def __init__(self, endpoints, connect, retry_after=30):
+        self.endpoints = [HubEndpoint(url, capacity) for url, capacity in endpoints]
+        self.connect = connect
+        self.retry_after = retry_after
+        self._owners = {}  # id(driver) -> endpoint
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse(spec):
+        # "http://hub1:4444/wd/hub|4, http://hub2:4444/wd/hub|2" -> [(url, capacity), ...]
+        endpoints = []
+        for entry in spec.replace('\n', ',').split(','):
+            entry = entry.strip()
+            if not entry:
+                continue
+            url, _, capacity = entry.partition('|')
+            endpoints.append((url.strip(), int(capacity) if capacity.strip() else 0))
+        return endpoints
+
+    def start_driver(self):
+        tried = set()
+        while True:
+            endpoint = self._reserve(tried)
+            if endpoint is None:
+                raise NoCapacityError('No healthy WebDriver endpoint with a free slot')
+            try:
+                driver = self.connect(endpoint.url)
+            except Exception as e:
+                logger.warning('Failed to start session on %s: %s', endpoint.url, e)
+                self._mark_failed(endpoint, e)
+                tried.add(endpoint.url)
+                continue
+            with self._lock:
+                endpoint.healthy = True
+                endpoint.last_error = None
+                self._owners[id(driver)] = endpoint
+            return driver
+
+    def release(self, driver):
+        with self._lock:
+            endpoint = self._owners.pop(id(driver), None)
+            if endpoint:
+                endpoint.active = max(endpoint.active - 1, 0)
+
+    def utilization(self):
+        with self._lock:
+            return [endpoint.to_dict() for endpoint in self.endpoints]
+
+    def _reserve(self, tried):
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                endpoint for endpoint in self.endpoints
+                if endpoint.url not in tried
+                and endpoint.has_free_slot()
+                and (endpoint.healthy or endpoint.retry_at <= now)
+            ]
+            if not candidates:
+                return None
+            endpoint = min(candidates, key=lambda e: (not e.healthy, e.load, e.active))
+            endpoint.active += 1
+            return endpoint
+
+    def _mark_failed(self, endpoint, error):
+        with self._lock:
+            endpoint.active = max(endpoint.active - 1, 0)
+            endpoint.healthy = False
+            endpoint.failures += 1
+            endpoint.last_error = str(error)
+            endpoint.retry_at = time.monotonic() + self.retry_after
@@ -0,0 +1,62 @@
+from flask import request, url_for
+from src.models import CatalogChange
+from src.http_utils import content_etag
+
+# Page size used when ?cursor= is given without ?limit=, and the largest one accepted
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class ListingError(ValueError):
+    pass
+
+
+def list_options(model):
+    """The ?fields=, ?limit= and ?cursor= arguments of a list request. Without
+    limit and cursor the whole list is returned, as before pagination existed."""
+    fields = request.args.get('fields')
+    if fields:
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+        unknown = [field for field in fields if field not in model.LIST_FIELDS]
+        if unknown:
+            raise ListingError(f'Unknown fields: {", ".join(unknown)}')
+    else:
+        fields = None
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    try:
+        limit = int(limit) if limit is not None else (DEFAULT_LIMIT if cursor is not None else None)
+        cursor = int(cursor) if cursor is not None else None
+    except ValueError:
+        raise ListingError('limit and cursor must be integers')
+    if limit is not None and not 0 < limit <= MAX_LIMIT:
+        raise ListingError(f'limit must be between 1 and {MAX_LIMIT}')
+    return fields, limit, cursor
+
+
+def paginate(query, model, limit, cursor):
+    """Rows of query in id order after the cursor, the id of the last row.
+    Returns the rows and the cursor of the next page, None on the last page."""
+    query = query.order_by(model.id)
+    if cursor is not None:
+        query = query.filter(model.id > cursor)
+    if limit is None:
+        return query.all(), None
+    rows = query.limit(limit + 1).all()
+    if len(rows) > limit:
+        return rows[:limit], rows[limit - 1].id
+    return rows, None
+
+
+def list_etag():
+    # Lists only change with the catalog revision, so the tag is known before querying
+    return content_etag(f'{CatalogChange.current()}:{request.full_path}')
+
+
+def next_page_headers(next_cursor):
+    # The list keeps its plain array shape, the next page is announced in headers
+    if next_cursor is None:
+        return {}
+    args = {**request.view_args, **request.args.to_dict(), 'cursor': next_cursor}
+    url = url_for(request.endpoint, **args)
+    return {'X-Next-Cursor': str(next_cursor), 'Link': f'<{url}>; rel="next"'}
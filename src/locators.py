@@ -0,0 +1,34 @@
+from selenium.webdriver.common.by import By
+
+# A selector may carry an id, a CSS selector and/or an XPath. They are reduced
+# to one locator string, the fastest available kind first. id= and css=
+# prefixes can never start a valid XPath, so plain XPaths stay unchanged and
+# existing definitions keep their result keys.
+LOCATOR_KINDS = ('id', 'css', 'xpath')
+
+
+def normalize_visible(value):
+    # The visible flag is optional and may have been stored as a string
+    if isinstance(value, str):
+        if value.lower() == 'true':
+            return True
+        if value.lower() == 'false':
+            return False
+    return value
+
+
+def selector_locator(selector):
+    for kind in LOCATOR_KINDS:
+        value = selector.get(kind)
+        if value:
+            return value if kind == 'xpath' else f'{kind}={value}'
+    return None
+
+
+def to_by(locator):
+    # (By, value) pair for driver.find_element
+    if locator.startswith('id='):
+        return By.ID, locator[3:]
+    if locator.startswith('css='):
+        return By.CSS_SELECTOR, locator[4:]
+    return By.XPATH, locator
@@ -1,15 +1,17 @@
+import time
 from src import db
+from src.locators import normalize_visible
 
 class Application(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), index=True, unique=True, nullable=False)
     pages = db.relationship('Page', backref='application', lazy='dynamic', cascade='all, delete-orphan')
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name
-        }
+    LIST_FIELDS = ('id', 'name')
+
+    def to_dict(self, fields=None):
+        fields = fields or self.LIST_FIELDS
+        return {field: getattr(self, field) for field in fields}
 
 class Page(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -17,16 +19,171 @@ class Page(db.Model):
     application_id = db.Column(db.Integer, db.ForeignKey('application.id'), nullable=False)
     url = db.Column(db.String(256))
     can_be_navigated_to = db.Column(db.Boolean, default=False)
-    identifying_selectors = db.Column(db.JSON, nullable=False)  # List of {'alias': '...', 'xpath': '...', 'visible': true/false (optional)}
-    interactive_selectors = db.Column(db.JSON)   # List of {'alias': '...', 'xpath': '...', 'visible': true/false (optional)}
+    # Selectors live in the selector table, loaded together with the pages
+    selectors = db.relationship('Selector', backref='page', lazy='selectin', order_by='Selector.position',
+                                cascade='all, delete-orphan')
+    # JSON selector lists of databases created before the selector table. They are
+    # read while the page has no selector rows and moved over by `flask selectors
+    # backfill`, or by the first edit of the page's selectors
+    legacy_identifying_selectors = db.Column('identifying_selectors', db.JSON(none_as_null=True))
+    legacy_interactive_selectors = db.Column('interactive_selectors', db.JSON(none_as_null=True))
+
+    # Lists of {'alias': '...', 'xpath': '...', 'css': '...' (optional), 'id': '...' (optional), 'visible': true/false (optional)},
+    # the fastest locator wins: id, then css, then xpath
+    @property
+    def identifying_selectors(self):
+        if self.has_legacy_selectors:
+            return list(self.legacy_identifying_selectors or [])
+        return [selector.to_dict() for selector in self.selectors if selector.kind == 'identifying']
+
+    @identifying_selectors.setter
+    def identifying_selectors(self, selectors):
+        self._set_selectors('identifying', selectors)
+
+    @property
+    def interactive_selectors(self):
+        if self.has_legacy_selectors:
+            return list(self.legacy_interactive_selectors or [])
+        return [selector.to_dict() for selector in self.selectors if selector.kind == 'interactive']
+
+    @interactive_selectors.setter
+    def interactive_selectors(self, selectors):
+        self._set_selectors('interactive', selectors)
+
+    @property
+    def has_legacy_selectors(self):
+        # Not moved to selector rows yet
+        return not self.selectors and bool(self.legacy_identifying_selectors or self.legacy_interactive_selectors)
+
+    def move_legacy_selectors(self):
+        identifying, interactive = self.legacy_identifying_selectors or [], self.legacy_interactive_selectors or []
+        self.legacy_identifying_selectors = None
+        self.legacy_interactive_selectors = None
+        self.selectors = [Selector.from_dict(kind, position, data)
+                          for kind, selectors in (('identifying', identifying), ('interactive', interactive))
+                          for position, data in enumerate(selectors)]
+
+    def _set_selectors(self, kind, selectors):
+        if self.has_legacy_selectors:
+            # The other kind keeps its legacy selectors as rows
+            self.move_legacy_selectors()
+        kept = [selector for selector in self.selectors if selector.kind != kind]
+        self.selectors = kept + [Selector.from_dict(kind, position, data) for position, data in enumerate(selectors or [])]
+
+    LIST_FIELDS = ('id', 'name', 'application_id', 'url', 'can_be_navigated_to', 'identifying_selectors',
+                   'interactive_selectors')
+    SELECTOR_FIELDS = ('identifying_selectors', 'interactive_selectors')
+
+    def to_dict(self, fields=None):
+        # Only the requested fields, the selector lists are built on demand
+        fields = fields or self.LIST_FIELDS
+        return {field: getattr(self, field) for field in fields}
+
+class Selector(db.Model):
+    # One identifying or interactive selector of a page
+    __table_args__ = (db.Index('ix_selector_page_id_alias', 'page_id', 'alias'),)
+    id = db.Column(db.Integer, primary_key=True)
+    page_id = db.Column(db.Integer, db.ForeignKey('page.id'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)  # 'identifying' or 'interactive'
+    position = db.Column(db.Integer, nullable=False, default=0)
+    alias = db.Column(db.String(128))
+    xpath = db.Column(db.String(1024), index=True)
+    css = db.Column(db.String(1024))
+    element_id = db.Column(db.String(256))
+    visible = db.Column(db.Boolean)
+    extra = db.Column(db.JSON)  # Any other keys of the selector, kept as they are
+
+    FIELDS = ('alias', 'xpath', 'css', 'id', 'visible')
+
+    @classmethod
+    def find(cls, page_id, alias):
+        # Identifying selectors win over interactive ones with the same alias
+        return cls.query.filter_by(page_id=page_id, alias=alias).order_by(cls.kind, cls.position).first()
+
+    @classmethod
+    def from_dict(cls, kind, position, data):
+        visible = normalize_visible(data.get('visible'))
+        extra = {key: value for key, value in data.items() if key not in cls.FIELDS}
+        return cls(
+            kind=kind,
+            position=position,
+            alias=data.get('alias'),
+            xpath=data.get('xpath'),
+            css=data.get('css'),
+            element_id=data.get('id'),
+            visible=None if visible is None else bool(visible),
+            extra=extra or None
+        )
+
+    def to_dict(self):
+        data = {'alias': self.alias}
+        for key, value in (('xpath', self.xpath), ('css', self.css), ('id', self.element_id), ('visible', self.visible)):
+            if value is not None:
+                data[key] = value
+        data.update(self.extra or {})
+        return data
+
+class BrowserSession(db.Model):
+    # Shared registry of open browser sessions, see src/session_registry.py
+    session_id = db.Column(db.String(36), primary_key=True)
+    remote_session_id = db.Column(db.String(64), nullable=False)
+    executor_url = db.Column(db.String(256), nullable=False)
+    owner = db.Column(db.String(128))
+    created_at = db.Column(db.Float, default=time.time)
+    last_used = db.Column(db.Float, default=time.time)
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'remote_session_id': self.remote_session_id,
+            'executor_url': self.executor_url,
+            'owner': self.owner,
+            'created_at': self.created_at,
+            'last_used': self.last_used
+        }
+
+class CatalogRevision(db.Model):
+    # Single row counter handing out catalog revisions. Incrementing it locks the
+    # row until the write's transaction ends, so catalog writes are serialized and
+    # revisions become visible in order, without gaps a reader could skip
+    id = db.Column(db.Integer, primary_key=True)
+    revision = db.Column(db.Integer, nullable=False)
+
+class CatalogChange(db.Model):
+    # One write to an application or page; the id is the catalog revision that
+    # clients and other workers compare to notice changes
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    entity = db.Column(db.String(16), nullable=False)  # 'application' or 'page'
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(16), nullable=False)  # 'created', 'updated' or 'deleted'
+    timestamp = db.Column(db.Float, default=time.time)
+
+    @classmethod
+    def record(cls, entity, entity_id, action):
+        # Part of the current transaction, so the revision moves with the write's commit
+        counter = CatalogRevision.__table__
+        bumped = db.session.execute(
+            counter.update().where(counter.c.id == 1).values(revision=counter.c.revision + 1))
+        if bumped.rowcount == 0:
+            # First write, continuing after changes recorded before the counter existed
+            db.session.execute(counter.insert().values(id=1, revision=cls.current() + 1))
+        revision = db.session.execute(db.select(counter.c.revision).where(counter.c.id == 1)).scalar()
+        db.session.add(cls(id=revision, entity=entity, entity_id=entity_id, action=action))
+
+    @classmethod
+    def current(cls):
+        return db.session.query(db.func.max(cls.id)).scalar() or 0
+
+    @classmethod
+    def since(cls, revision, limit=None):
+        query = cls.query.filter(cls.id > revision).order_by(cls.id)
+        return query.limit(limit).all() if limit else query.all()
 
     def to_dict(self):
         return {
-            'id': self.id,
-            'name': self.name,
-            'application_id': self.application_id,
-            'url': self.url,
-            'can_be_navigated_to': self.can_be_navigated_to,
-            'identifying_selectors': self.identifying_selectors,
-            'interactive_selectors': self.interactive_selectors
-        }
\ No newline at end of file
+            'revision': self.id,
+            'entity': self.entity,
+            'id': self.entity_id,
+            'action': self.action,
+            'timestamp': self.timestamp
+        }
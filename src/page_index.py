@@ -0,0 +1,100 @@
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from src.models import Page, CatalogChange
+from src.locators import normalize_visible, selector_locator
+
+
+class PageIndex:
+    """Precomputed page identification data.
+
+    Holds the unique identifying locators (XPaths, or id=/css= locators, see
+    src/locators.py), the pages depending on each of them and the visibility
+    every page requires. Locators shared by many pages come first so a single
+    evaluation settles as many pages as possible, and each page is rejected at
+    its first failing selector.
+    """
+
+    def __init__(self, pages):
+        self.pages = []
+        requirements = []
+        dependents = defaultdict(list)
+        for page in pages:
+            selectors = page.get('identifying_selectors') or []
+            locators = [selector_locator(selector) for selector in selectors]
+            # Pages without identifying selectors, or with one lacking a locator, never match
+            if not selectors or not all(locators):
+                continue
+            position = len(self.pages)
+            self.pages.append(page)
+            requirements.append([(locator, normalize_visible(s.get('visible'))) for locator, s in zip(locators, selectors)])
+            for xpath in set(locators):
+                dependents[xpath].append(position)
+
+        self.xpaths = sorted(dependents, key=lambda xpath: (-len(dependents[xpath]), xpath))
+        self.dependents = {xpath: dependents[xpath] for xpath in self.xpaths}
+        order = {xpath: i for i, xpath in enumerate(self.xpaths)}
+        self.requirements = [
+            sorted(((order[xpath], visible) for xpath, visible in page_requirements), key=lambda r: r[0])
+            for page_requirements in requirements
+        ]
+        # The in-page plan cache is keyed by content: workers sharing a browser
+        # through the session registry agree on the key of an identical plan and
+        # never reuse one another's plan for different pages
+        content = json.dumps([self.xpaths, self.requirements], separators=(',', ':'))
+        self.key = hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def plan(self):
+        # Compact form evaluated by the in-page selector engine
+        return {
+            'key': self.key,
+            'xpaths': self.xpaths,
+            'pages': [[[index, visible] for index, visible in page] for page in self.requirements]
+        }
+
+    def match(self, selector_results):
+        # Same rules as the in-page matcher, for results of check_selectors
+        matched = []
+        for page, requirements in zip(self.pages, self.requirements):
+            for index, visible in requirements:
+                result = selector_results.get(self.xpaths[index], {})
+                if not result.get('existing', False):
+                    break
+                if visible is not None and result.get('visible', False) != visible:
+                    break
+            else:
+                matched.append(page)
+        return matched
+
+
+class PageIndexCache:
+    """Process wide PageIndex over all pages, rebuilt after page edits. Edits
+    made by other workers are noticed through the catalog revision, which is
+    read at most every revision_interval seconds."""
+
+    def __init__(self, revision_interval=1.0):
+        self.revision_interval = revision_interval
+        self._index = None
+        self._revision = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if time.monotonic() - self._checked >= self.revision_interval:
+                revision = CatalogChange.current()
+                self._checked = time.monotonic()
+                if revision != self._revision:
+                    self._index, self._revision = None, revision
+            if self._index is None:
+                self._index = PageIndex([page.to_dict() for page in Page.query.all()])
+            return self._index
+
+    def invalidate(self):
+        with self._lock:
+            self._index = None
+
+
+page_index = PageIndexCache()
@@ -0,0 +1,63 @@
+from src import selector_engine
+from src.browser_manager import browser_manager
+from src.session_executor import SessionBusyError
+
+
+class PageWatch:
+    """Follows the matched pages of one session for a WebSocket subscriber.
+
+    The browser re-evaluates the page index itself on DOM mutations and URL
+    changes; poll() only reads the cheap watch status on the session's
+    command thread and never blocks the caller.
+    """
+
+    def __init__(self, session_id, debounce_ms=150):
+        self.session_id = session_id
+        self.debounce_ms = debounce_ms
+        self._future = None
+        self._seen = None  # (document id, version) last read
+        self._matched_ids = None  # ids of the pages last reported
+
+    def poll(self, index):
+        """Return the matched page dicts when they changed since the last
+        call, otherwise None. Raises SessionNotFoundError once the session
+        is gone."""
+        changed = None
+        if self._future is not None:
+            if not self._future.done():
+                return None
+            future, self._future = self._future, None
+            changed = self._changed(index, *future.result())
+        try:
+            self._future = browser_manager.submit(self.session_id, self._read_status, index)
+        except SessionBusyError:
+            # Busy with commands, try again on the next poll
+            pass
+        return changed
+
+    def _changed(self, index, read_index, status):
+        if read_index is not index or status.get('key') != index.key or status.get('matched') is None:
+            return None
+        seen = (status['id'], status['version'])
+        if seen == self._seen:
+            return None
+        self._seen = seen
+        pages = [index.pages[i] for i in status['matched']]
+        # A new document matching the same pages is not a change for the subscriber
+        matched_ids = [page.get('id') for page in pages]
+        if matched_ids == self._matched_ids:
+            return None
+        self._matched_ids = matched_ids
+        return pages
+
+    def cancel(self):
+        if self._future is not None:
+            self._future.cancel()
+
+    def _read_status(self, driver, index):
+        status = selector_engine.call(driver, 'watchStatus')
+        if status.get('__watchMissing') or status.get('key') != index.key:
+            status = selector_engine.call(driver, 'watch', index.key, None, self.debounce_ms)
+            if status.get('__planMissing'):
+                status = selector_engine.call(driver, 'watch', index.key, index.plan(), self.debounce_ms)
+        return index, status
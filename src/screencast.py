@@ -0,0 +1,76 @@
+import base64
+import time
+from src.browser_actions import BrowserActions, PILLOW_REQUIRED
+from src.browser_manager import browser_manager
+from src.session_executor import SessionBusyError
+
+# Sessions without Chrome DevTools or Pillow only deliver full PNGs, at this rate at most
+PNG_MAX_FPS = 1
+# Frames are skipped while the view state is unchanged, but not for longer than this
+KEYFRAME_INTERVAL = 2.0
+
+
+class Screencast:
+    """Streams compressed frames of one session to a WebSocket subscriber.
+
+    Chrome, local or remote, captures the scaled JPEG through DevTools; other
+    drivers fall back to WebDriver screenshots, converted with Pillow when
+    available and sent as throttled PNGs otherwise. At most one capture is in flight and captures
+    are skipped while the session runs commands, so a slow client or a busy
+    session only lowers the frame rate.
+    """
+
+    def __init__(self, session_id, fps=2, scale=0.5, quality=60):
+        self.session_id = session_id
+        self.fps = fps
+        self.scale = scale
+        self.quality = quality
+        self.image_format = 'jpeg'
+        self._future = None
+        self._next_capture = 0
+        self._state = None  # view state of the last frame
+        self._sent_at = 0
+
+    def poll(self):
+        """Return the next frame {format, data, timestamp} when one is ready,
+        otherwise None. Raises SessionNotFoundError once the session
+        is gone."""
+        frame = None
+        if self._future is not None:
+            if not self._future.done():
+                return None
+            future, self._future = self._future, None
+            frame = future.result()
+        now = time.monotonic()
+        if now >= self._next_capture and not browser_manager.is_busy(self.session_id):
+            fps = self.fps if self.image_format != 'png' else min(self.fps, PNG_MAX_FPS)
+            self._next_capture = now + 1 / fps
+            try:
+                self._future = browser_manager.submit(self.session_id, self._capture, now - self._sent_at >= KEYFRAME_INTERVAL)
+            except SessionBusyError:
+                pass
+        return frame
+
+    def cancel(self):
+        if self._future is not None:
+            self._future.cancel()
+
+    def _capture(self, driver, keyframe):
+        actions = BrowserActions(driver)
+        state = actions.view_state()
+        if state is not None and state == self._state and not keyframe:
+            return None
+        data, error = actions.take_screenshot(self.image_format, quality=self.quality, scale=self.scale)
+        if error == PILLOW_REQUIRED:
+            # Plain WebDriver screenshots only, unscaled PNGs at a lower rate
+            self.image_format = 'png'
+            data, error = actions.take_screenshot('png')
+        if error:
+            return None
+        self._state = state
+        self._sent_at = time.monotonic()
+        return {
+            'format': self.image_format,
+            'data': base64.b64encode(data).decode('ascii'),
+            'timestamp': time.time()
+        }
@@ -0,0 +1,438 @@
+# Static helper that is installed once per document as window.__easyAutomate.
+# Calls only send their data as script arguments; when the helper is missing
+# (first call or after a navigation replaced the document) it is installed and
+# the call is repeated in the same round trip.
+
+ENGINE_VERSION = 12
+
+ENGINE_JS = '''
+(function () {
+    if (window.__easyAutomate && window.__easyAutomate.version === %(version)d) return;
+
+    // Revision of this document: a random token for the document (the engine
+    // is installed once per document) and a counter of DOM mutations
+    const documentId = Math.random().toString(36).slice(2);
+    let revision = 0;
+    new MutationObserver(function () { revision++; }).observe(
+        document, {childList: true, subtree: true, attributes: true, characterData: true});
+
+    function domRevision() {
+        return documentId + '-' + revision;
+    }
+
+    // Everything a screenshot depends on that the page exposes cheaply
+    function viewState() {
+        return [domRevision(), window.scrollX, window.scrollY, window.innerWidth, window.innerHeight,
+                window.devicePixelRatio].join(':');
+    }
+
+    // Screenshot region in document coordinates: the box of the element
+    // behind locator, a viewport relative rect or the whole viewport
+    function pageRect(locator, rect) {
+        if (locator) {
+            const el = find(locator);
+            if (!el) return null;
+            const r = el.getBoundingClientRect();
+            rect = {x: r.left, y: r.top, width: r.width, height: r.height};
+        } else if (!rect) {
+            rect = {x: 0, y: 0, width: window.innerWidth, height: window.innerHeight};
+        }
+        return {x: rect.x + window.scrollX, y: rect.y + window.scrollY, width: rect.width, height: rect.height};
+    }
+
+    // Markup with its revision, or only the revision when it is one of known
+    function domSnapshot(known) {
+        const tag = domRevision();
+        if (known && known.indexOf(tag) !== -1) return {tag: tag, unchanged: true};
+        const doctype = document.doctype ? '<!DOCTYPE ' + document.doctype.name + '>' : '';
+        return {tag: tag, html: doctype + document.documentElement.outerHTML};
+    }
+
+    // Element.checkVisibility() settles display and opacity of the whole
+    // ancestor chain natively; other browsers walk the chain themselves
+    const nativeVisibility = typeof Element.prototype.checkVisibility === 'function';
+    // Ancestor verdicts, only kept for the duration of one evaluation pass
+    let memo = null;
+
+    function styleVisible(el) {
+        const s = window.getComputedStyle(el);
+        if (s.display === 'none' || s.visibility === 'hidden') return false;
+        if (el.getAttribute('aria-hidden') === 'true') return false;
+        return parseFloat(s.opacity) !== 0;
+    }
+
+    // checkVisibility() only reads the element's own visibility, a
+    // visibility:visible child of a hidden container would pass. Like the
+    // legacy check, any visibility:hidden ancestor hides the element
+    function chainVisible(el) {
+        if (el.getAttribute('aria-hidden') === 'true') return false;
+        return window.getComputedStyle(el).visibility !== 'hidden';
+    }
+
+    // Whether test() holds for el and all of its ancestors
+    function chainPasses(el, test) {
+        const chain = [];
+        let verdict = true;
+        for (let cur = el; cur; cur = cur.parentElement) {
+            if (memo && memo.has(cur)) {
+                verdict = memo.get(cur);
+                break;
+            }
+            chain.push(cur);
+        }
+        // Settle from the top so every element on the way is memoized
+        for (let i = chain.length - 1; i >= 0; i--) {
+            if (verdict) verdict = test(chain[i]);
+            if (memo) memo.set(chain[i], verdict);
+        }
+        return verdict;
+    }
+
+    function isElementVisible(el) {
+        if (!el) return false;
+        if (el.nodeType == Node.TEXT_NODE) return isElementVisible(el.parentElement);
+        if (!(el instanceof Element)) return false;
+        if (!document.documentElement.contains(el)) return false;
+        if (el.getClientRects().length === 0) return false;
+        if (nativeVisibility) {
+            if (!el.checkVisibility({opacityProperty: true})) return false;
+            if (!chainPasses(el, chainVisible)) return false;
+        } else if (!chainPasses(el, styleVisible)) {
+            return false;
+        }
+        const r = el.getBoundingClientRect();
+        if (r.width <= 0 || r.height <= 0) return false;
+        return true;
+    }
+
+    // Runs fn as one evaluation pass sharing the ancestor verdicts
+    function pass(fn) {
+        return function () {
+            if (memo) return fn.apply(null, arguments);
+            memo = new Map();
+            try {
+                return fn.apply(null, arguments);
+            } finally {
+                memo = null;
+            }
+        };
+    }
+
+    // Locators from src/locators.py: id=..., css=... or a plain XPath
+    function find(locator) {
+        if (locator.startsWith('id=')) return document.getElementById(locator.slice(3));
+        if (locator.startsWith('css=')) return document.querySelector(locator.slice(4));
+        return document.evaluate(locator, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+    }
+
+    function checkOne(xpath) {
+        try {
+            const el = find(xpath);
+            const exists = !!el;
+            return {existing: exists, visible: exists ? isElementVisible(el) : false, xpath: xpath};
+        } catch (e) {
+            console.error('Error evaluating locator ' + xpath + ':', e);
+            return {existing: false, visible: false, error: String(e)};
+        }
+    }
+
+    const check = pass(function (xpaths) {
+        const result = {};
+        for (const xpath of xpaths) {
+            result[xpath] = checkOne(xpath);
+        }
+        return result;
+    });
+
+    // Page identification plans from src/page_index.py, only the latest one is kept
+    let plans = {};
+
+    function satisfies(result, visible) {
+        if (!result.existing) return false;
+        return visible === null || visible === undefined || result.visible === visible;
+    }
+
+    const evaluatePlan = pass(function (plan) {
+        const results = new Array(plan.xpaths.length);
+        const matched = [];
+        for (let p = 0; p < plan.pages.length; p++) {
+            let ok = true;
+            for (const [index, visible] of plan.pages[p]) {
+                const result = results[index] || (results[index] = checkOne(plan.xpaths[index]));
+                if (!satisfies(result, visible)) {
+                    ok = false;
+                    break;
+                }
+            }
+            if (ok) matched.push(p);
+        }
+        return matched;
+    });
+
+    function matchPages(key, plan) {
+        if (plan) plans = {[key]: plan};
+        plan = plans[key];
+        if (!plan) return {__planMissing: true};
+        return evaluatePlan(plan);
+    }
+
+    // Async: resolves as soon as one page of the plan matches, re-evaluating on
+    // every DOM mutation. Visibility may also change through styles or layout
+    // without a mutation, so a slow interval re-checks as well.
+    function waitForPages(plan, timeoutMs, done) {
+        const start = performance.now();
+        let finished = false;
+        let observer = null;
+        let interval = null;
+        let timer = null;
+
+        function finish(result) {
+            if (finished) return;
+            finished = true;
+            if (observer) observer.disconnect();
+            clearInterval(interval);
+            clearTimeout(timer);
+            result.elapsed_ms = performance.now() - start;
+            done(result);
+        }
+
+        function evaluate() {
+            if (finished) return;
+            const matched = evaluatePlan(plan);
+            if (matched.length) finish({matched: matched});
+        }
+
+        evaluate();
+        if (finished) return;
+        observer = new MutationObserver(evaluate);
+        observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+        interval = setInterval(evaluate, 100);
+        timer = setTimeout(function () { finish({matched: [], timeout: true}); }, timeoutMs);
+    }
+
+    // Re-evaluates the latest plan after DOM mutations and URL changes. The
+    // version only changes when the set of matched pages changes, the server
+    // reads it with watchStatus().
+    const watchState = {
+        id: documentId,
+        key: null,
+        version: 0,
+        matched: null,
+        debounce: 150,
+        maxDelay: 1000,
+        timer: null,
+        scheduledAt: 0,
+        observer: null
+    };
+
+    function evaluateWatch() {
+        clearTimeout(watchState.timer);
+        watchState.timer = null;
+        const matched = matchPages(watchState.key, null);
+        if (!Array.isArray(matched)) return;
+        if (watchState.matched === null || matched.join(',') !== watchState.matched.join(',')) {
+            watchState.matched = matched;
+            watchState.version++;
+        }
+    }
+
+    function scheduleWatch() {
+        // Debounce bursts of mutations, but never postpone longer than maxDelay
+        const now = Date.now();
+        if (watchState.timer) {
+            if (now - watchState.scheduledAt >= watchState.maxDelay) return evaluateWatch();
+            clearTimeout(watchState.timer);
+        } else {
+            watchState.scheduledAt = now;
+        }
+        watchState.timer = setTimeout(evaluateWatch, watchState.debounce);
+    }
+
+    function watchStatus() {
+        if (watchState.key === null) return {__watchMissing: true};
+        return {
+            id: watchState.id,
+            key: watchState.key,
+            version: watchState.version,
+            matched: watchState.matched,
+            url: location.href
+        };
+    }
+
+    function watch(key, plan, debounce) {
+        if (plan) plans = {[key]: plan};
+        if (!plans[key]) return {__planMissing: true};
+        if (watchState.key !== key) watchState.matched = null;
+        watchState.key = key;
+        if (debounce !== null && debounce !== undefined) watchState.debounce = debounce;
+        if (!watchState.observer) {
+            watchState.observer = new MutationObserver(scheduleWatch);
+            watchState.observer.observe(document, {childList: true, subtree: true, attributes: true, characterData: true});
+            window.addEventListener('popstate', scheduleWatch);
+            window.addEventListener('hashchange', scheduleWatch);
+            for (const name of ['pushState', 'replaceState']) {
+                const original = history[name];
+                history[name] = function () {
+                    const result = original.apply(this, arguments);
+                    scheduleWatch();
+                    return result;
+                };
+            }
+        }
+        evaluateWatch();
+        return watchStatus();
+    }
+
+    function readValue(el) {
+        const value = 'value' in el ? el.value : el.getAttribute('value');
+        return value || (el.innerText || '').trim();
+    }
+
+    // Assigns through the native value setter, which frameworks tracking the
+    // value property (React) observe, then fires the events of a user edit
+    function setValue(el, value) {
+        if (el.isContentEditable) {
+            el.textContent = value;
+        } else {
+            let proto = Object.getPrototypeOf(el);
+            let descriptor = null;
+            while (proto && !(descriptor = Object.getOwnPropertyDescriptor(proto, 'value'))) {
+                proto = Object.getPrototypeOf(proto);
+            }
+            if (descriptor && descriptor.set) descriptor.set.call(el, value);
+            else el.value = value;
+        }
+        el.dispatchEvent(new Event('input', {bubbles: true}));
+        el.dispatchEvent(new Event('change', {bubbles: true}));
+        return true;
+    }
+
+    // Form snapshot: value, text and visibility for each XPath, in order
+    const readValues = pass(function (xpaths) {
+        return xpaths.map(function (xpath) {
+            try {
+                const el = find(xpath);
+                if (!el) return {existing: false};
+                return {
+                    existing: true,
+                    value: readValue(el),
+                    text: (el.innerText || '').trim(),
+                    visible: isElementVisible(el)
+                };
+            } catch (e) {
+                return {existing: false, error: String(e)};
+            }
+        });
+    });
+
+    // Copy of the document without scripts, images, styles, stylesheet links
+    // and svg contents, same pruning as src/dom_cleaner.py. The copy lives in an
+    // inert document so nothing in it is fetched or run.
+    function cleanedDom() {
+        const inert = document.implementation.createHTMLDocument('');
+        const root = inert.importNode(document.documentElement, true);
+        for (const el of root.querySelectorAll('script, img, style, link')) el.remove();
+        for (const svg of root.querySelectorAll('svg')) svg.replaceChildren();
+        const doctype = document.doctype ? '<!DOCTYPE ' + document.doctype.name + '>' : '';
+        return doctype + root.outerHTML;
+    }
+
+    // Batch steps that only need the DOM: [{op: 'click' | 'get-value' | 'set-value', locator, value}]
+    function runSteps(steps, stopOnError) {
+        const results = [];
+        let failed = false;
+        for (const step of steps) {
+            if (failed && stopOnError) {
+                results.push(null);
+                continue;
+            }
+            const start = performance.now();
+            const result = {success: true};
+            try {
+                const el = find(step.locator);
+                if (!el) {
+                    result.success = false;
+                    result.error = 'Element not found';
+                } else if (step.op === 'click') {
+                    el.click();
+                } else if (step.op === 'get-value') {
+                    result.value = readValue(el);
+                } else if (step.op === 'set-value') {
+                    setValue(el, step.value);
+                } else {
+                    result.success = false;
+                    result.error = 'Unknown action: ' + step.op;
+                }
+            } catch (e) {
+                result.success = false;
+                result.error = String(e);
+            }
+            result.elapsed_ms = performance.now() - start;
+            failed = failed || !result.success;
+            results.push(result);
+        }
+        return results;
+    }
+
+    window.__easyAutomate = {
+        version: %(version)d,
+        isElementVisible: isElementVisible,
+        find: find,
+        checkOne: checkOne,
+        check: check,
+        matchPages: matchPages,
+        waitForPages: waitForPages,
+        watch: watch,
+        watchStatus: watchStatus,
+        runSteps: runSteps,
+        readValues: readValues,
+        setValue: setValue,
+        cleanedDom: cleanedDom,
+        domRevision: domRevision,
+        domSnapshot: domSnapshot,
+        viewState: viewState,
+        pageRect: pageRect
+    };
+})();
+''' % {'version': ENGINE_VERSION}
+
+CALL_JS = '''
+const engine = window.__easyAutomate;
+if (!engine || engine.version !== %(version)d) return {__easyAutomateMissing: true};
+return engine[arguments[0]].apply(null, arguments[1]);
+''' % {'version': ENGINE_VERSION}
+
+INSTALL_AND_CALL_JS = ENGINE_JS + CALL_JS
+
+ASYNC_CALL_JS = '''
+const done = arguments[arguments.length - 1];
+const engine = window.__easyAutomate;
+if (!engine || engine.version !== %(version)d) {
+    done({__easyAutomateMissing: true});
+    return;
+}
+engine[arguments[0]].apply(null, arguments[1].concat([done]));
+''' % {'version': ENGINE_VERSION}
+
+INSTALL_AND_CALL_ASYNC_JS = ENGINE_JS + ASYNC_CALL_JS
+
+
+def _missing(result):
+    return isinstance(result, dict) and result.get('__easyAutomateMissing') is True
+
+
+def call(driver, method, *args):
+    """Call ``window.__easyAutomate[method](*args)`` in the current document."""
+    result = driver.execute_script(CALL_JS, method, list(args))
+    if _missing(result):
+        result = driver.execute_script(INSTALL_AND_CALL_JS, method, list(args))
+    return result
+
+
+def call_async(driver, method, *args):
+    """Like call() for engine methods that report through a callback; the
+    driver's script timeout must cover the call."""
+    result = driver.execute_async_script(ASYNC_CALL_JS, method, list(args))
+    if _missing(result):
+        result = driver.execute_async_script(INSTALL_AND_CALL_ASYNC_JS, method, list(args))
+    return result
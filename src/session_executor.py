@@ -0,0 +1,74 @@
+import queue
+import threading
+from concurrent.futures import Future
+
+
+class SessionBusyError(Exception):
+    pass
+
+
+class SessionClosedError(Exception):
+    pass
+
+
+class SessionExecutor:
+    """Runs the WebDriver commands of one browser session in order on a
+    dedicated worker thread, so commands of different sessions run in
+    parallel while commands of the same session never interleave."""
+
+    def __init__(self, name, max_queue=16):
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._running = 0
+        self._closed = False
+        # Held while checking _closed and queueing, nothing is queued after the sentinel
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name=f'session-{name}', daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        return self._running > 0 or not self._queue.empty()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise SessionClosedError(f'Session {self.name} is closed')
+            try:
+                self._queue.put_nowait((future, fn, args, kwargs))
+            except queue.Full:
+                raise SessionBusyError(f'Too many pending commands for session {self.name}')
+        return future
+
+    def run(self, fn, *args, timeout=None, **kwargs):
+        return self.submit(fn, *args, **kwargs).result(timeout)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            # Cancel whatever is still waiting, the running command is left to finish
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+            self._queue.put_nowait(None)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._running += 1
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                self._running -= 1
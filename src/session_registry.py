@@ -0,0 +1,157 @@
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from src import db
+from src.models import BrowserSession
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def current_owner():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class MemorySessionRegistry:
+    """Process local registry; sessions are only visible to the worker that
+    created them. Used when no shared registry is configured."""
+
+    shared = False
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def register(self, session_id, remote_session_id, executor_url, owner):
+        now = time.time()
+        with self._lock:
+            self._entries[session_id] = {
+                'session_id': session_id,
+                'remote_session_id': remote_session_id,
+                'executor_url': executor_url,
+                'owner': owner,
+                'created_at': now,
+                'last_used': now
+            }
+
+    def lookup(self, session_id):
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return dict(entry) if entry else None
+
+    def touch(self, session_id):
+        with self._lock:
+            if session_id in self._entries:
+                self._entries[session_id]['last_used'] = time.time()
+
+    def unregister(self, session_id):
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+
+class DatabaseSessionRegistry:
+    """Stores sessions in the application database so every worker process
+    can reattach to a session created by another one."""
+
+    shared = True
+
+    def __init__(self, app):
+        self.app = app
+
+    def register(self, session_id, remote_session_id, executor_url, owner):
+        with self.app.app_context():
+            db.session.merge(BrowserSession(
+                session_id=session_id,
+                remote_session_id=remote_session_id,
+                executor_url=executor_url,
+                owner=owner
+            ))
+            db.session.commit()
+
+    def lookup(self, session_id):
+        with self.app.app_context():
+            entry = db.session.get(BrowserSession, session_id)
+            return entry.to_dict() if entry else None
+
+    def touch(self, session_id):
+        with self.app.app_context():
+            BrowserSession.query.filter_by(session_id=session_id).update({'last_used': time.time()})
+            db.session.commit()
+
+    def unregister(self, session_id):
+        with self.app.app_context():
+            BrowserSession.query.filter_by(session_id=session_id).delete()
+            db.session.commit()
+
+
+class FileSessionRegistry:
+    """Keeps the sessions in a JSON file shared by the workers of one host."""
+
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def register(self, session_id, remote_session_id, executor_url, owner):
+        now = time.time()
+        with self._locked() as entries:
+            entries[session_id] = {
+                'session_id': session_id,
+                'remote_session_id': remote_session_id,
+                'executor_url': executor_url,
+                'owner': owner,
+                'created_at': now,
+                'last_used': now
+            }
+
+    def lookup(self, session_id):
+        with self._lock:
+            return self._read().get(session_id)
+
+    def touch(self, session_id):
+        with self._locked() as entries:
+            if session_id in entries:
+                entries[session_id]['last_used'] = time.time()
+
+    def unregister(self, session_id):
+        with self._locked() as entries:
+            entries.pop(session_id, None)
+
+    def _read(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @contextmanager
+    def _locked(self):
+        # Read-modify-write of the registry file under a thread and process lock
+        with self._lock, open(self.path + '.lock', 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                entries = self._read()
+                yield entries
+                tmp_path = f'{self.path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_registry(app):
+    kind = app.config.get('SESSION_REGISTRY', 'memory')
+    if kind == 'database':
+        return DatabaseSessionRegistry(app)
+    if kind == 'file':
+        return FileSessionRegistry(app.config['SESSION_REGISTRY_FILE'])
+    return MemorySessionRegistry()
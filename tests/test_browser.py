@@ -100,6 +100,80 @@ class BrowserManagerTestCase(unittest.TestCase):
         result = actions.check_selectors(selectors)
         self.assertIn(selectors[0], result)
         self.assertTrue(result[selectors[0]]['existing'])
+    def test_selector_engine_survives_navigation(self):
+        from src.browser_actions import BrowserActions
+        actions = BrowserActions(self.driver)
+        self.driver.get('http://localhost:5001/dummy1.html')
+        result = actions.check_selectors(["//*[@id='page-identifier-1']"])
+        self.assertTrue(result["//*[@id='page-identifier-1']"]['visible'])
+        # The new document no longer has the engine, it is installed again on the next call
+        self.driver.get('http://localhost:5001/dummy2.html')
+        self.assertIsNone(self.driver.execute_script('return window.__easyAutomate || null;'))
+        result = actions.check_selectors(["//*[@id='page-identifier-1']"])
+        self.assertFalse(result["//*[@id='page-identifier-1']"]['visible'])
+    def test_page_watch_reports_changes(self):
+        import time
+        from src.page_index import PageIndex
+        from src.page_watcher import PageWatch
+        index = PageIndex([
+            {'id': 'dummy1', 'identifying_selectors': [{'alias': 'id1', 'xpath': "//*[@id='page-identifier-1']", 'visible': True}]},
+            {'id': 'dummy2', 'identifying_selectors': [{'alias': 'id2', 'xpath': "//*[@id='page-identifier-2']", 'visible': True}]}
+        ])
+        watch = PageWatch(self.session_id, debounce_ms=50)
+
+        def next_change(timeout=5):
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                pages = watch.poll(index)
+                if pages is not None:
+                    return [page['id'] for page in pages]
+                time.sleep(0.05)
+            return None
+
+        self.driver.get('http://localhost:5001/dummy1.html')
+        self.assertEqual(next_change(), ['dummy1'])
+        # A DOM change that swaps the visible identifier is pushed without navigation
+        self.driver.execute_script(
+            "document.getElementById('page-identifier-1').style.display='none';"
+            "document.getElementById('page-identifier-2').style.display='block';")
+        self.assertEqual(next_change(), ['dummy2'])
+        watch.cancel()
+    def test_wait_for_pages_honors_visibility(self):
+        from src.browser_actions import BrowserActions
+        from src.page_index import PageIndex
+        actions = BrowserActions(self.driver)
+        index = PageIndex([{'id': 'dummy2', 'identifying_selectors': [
+            {'alias': 'id2', 'xpath': "//*[@id='page-identifier-2']", 'visible': True}
+        ]}])
+        self.driver.get('http://localhost:5001/dummy1.html')
+        # page-identifier-2 exists on dummy1 but is hidden
+        self.assertEqual(actions.wait_for_pages(index, timeout=0.5), [])
+        self.driver.execute_script(
+            "setTimeout(function () { document.getElementById('page-identifier-2').style.display = 'block'; }, 200);")
+        pages = actions.wait_for_pages(index, timeout=5)
+        self.assertEqual([page['id'] for page in pages], ['dummy2'])
+    def test_visibility_memo_matches_legacy_check(self):
+        from src.browser_actions import BrowserActions
+        actions = BrowserActions(self.driver)
+        self.driver.get('http://localhost:5001/visibility.html?sections=8&depth=10&fields=5')
+        xpaths = [f"//*[@id='field-{s}-{f}']" for s in range(8) for f in range(5)]
+        result = actions.check_selectors(xpaths)
+        legacy = self.driver.execute_script(BrowserActions._generate_selector_check_js(xpaths))
+        self.assertEqual({x: result[x]['visible'] for x in xpaths}, {x: legacy[x]['visible'] for x in xpaths})
+        # Sections are visible, visibility:hidden, aria-hidden, transparent and
+        # visibility:hidden around visibility:visible fields in turn
+        self.assertEqual([result[f"//*[@id='field-{s}-0']"]['visible'] for s in range(5)], [True, False, False, False, False])
+    def test_dom_revision_follows_mutations(self):
+        from src.browser_actions import BrowserActions
+        actions = BrowserActions(self.driver)
+        self.driver.get('http://localhost:5001/test.html')
+        snapshot = actions.get_dom_snapshot()
+        self.assertIn('test-element', snapshot['html'])
+        self.assertTrue(actions.get_dom_snapshot([snapshot['tag']])['unchanged'])
+        self.driver.execute_script("document.getElementById('test-element').textContent = 'Changed';")
+        changed = actions.get_dom_snapshot([snapshot['tag']])
+        self.assertNotEqual(changed['tag'], snapshot['tag'])
+        self.assertIn('Changed', changed['html'])
     def test_create_and_close_session(self):
         # Use the class session for testing close and re-create
         browser_manager.close_session(self.session_id)
@@ -114,6 +188,15 @@ class BrowserManagerTestCase(unittest.TestCase):
         self.assertIsInstance(screenshot, bytes)
         self.assertGreater(len(screenshot), 0)
 
+    def test_take_scaled_jpeg_screenshot(self):
+        from src.browser_actions import BrowserActions
+        self.driver.get('http://localhost:5001/test.html')
+        actions = BrowserActions(self.driver)
+        jpeg, error = actions.take_screenshot('jpeg', quality=50, scale=0.5, clip={'x': 0, 'y': 0, 'width': 100, 'height': 50})
+        self.assertIsNone(error)
+        self.assertTrue(jpeg.startswith(b'\xff\xd8'))
+        self.assertEqual(actions.view_state(), actions.view_state())
+
     def test_get_dom(self):
         self.driver.get('http://localhost:5001/test.html')
         dom = self.driver.page_source
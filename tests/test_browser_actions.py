@@ -0,0 +1,423 @@
+import unittest
+import uuid
+import json
+from unittest import mock
+from selenium.common.exceptions import NoSuchElementException, ElementNotInteractableException, JavascriptException, \
+    WebDriverException
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from src import create_app, db
+from src.models import Application, Page
+from src.browser_actions import BrowserActions
+from src.browser_manager import browser_manager
+from src.config import Config
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+
+class FakeElement:
+    def __init__(self, driver, name, value='', text='', visible=True, error=None):
+        self.driver = driver
+        self.error = error
+        self.name = name
+        self.value = value
+        self.text = text
+        self.visible = visible
+
+    def click(self):
+        if self.error:
+            raise self.error
+        self.driver.log.append(('click', self.name))
+
+    def clear(self):
+        self.value = ''
+
+    def send_keys(self, value):
+        self.value += value
+
+    def get_attribute(self, name):
+        return self.value if name == 'value' else None
+
+class FakeExecutor:
+    _url = 'http://hub/wd/hub'
+
+    def set_timeout(self, timeout):
+        pass
+
+class FakeDomDriver:
+    # Answers WebDriver lookups and the selector engine methods used by the
+    # actions from a dict of locator -> FakeElement
+    def __init__(self):
+        self.session_id = uuid.uuid4().hex
+        self.command_executor = FakeExecutor()
+        self.elements = {}
+        self.log = []
+        self.script_error = None
+        self.html = '<html><body></body></html>'
+        self.dom_revision = 0
+
+    def quit(self):
+        pass
+
+    def set_script_timeout(self, timeout):
+        pass
+
+    def add(self, locator, **kwargs):
+        self.elements[locator] = FakeElement(self, locator, **kwargs)
+
+    def find_element(self, by, value):
+        if value not in self.elements:
+            raise NoSuchElementException(value)
+        return self.elements[value]
+
+    def execute_script(self, script, method=None, args=None):
+        self.log.append(('script', method))
+        if self.script_error:
+            raise self.script_error
+        if method == 'runSteps':
+            return self._run_steps(*args)
+        if method == 'readValues':
+            return [self._read(locator) for locator in args[0]]
+        if method == 'setValue':
+            args[0].value = args[1]
+        if method == 'domSnapshot':
+            tag = f'rev-{self.dom_revision}'
+            return {'tag': tag, 'unchanged': True} if tag in args[0] else {'tag': tag, 'html': self.html}
+        return None
+
+    def execute_async_script(self, script, method=None, args=None):
+        # waitForPages answers at once: the matching pages, or a timeout
+        plan = args[0]
+        matched = [position for position, requirements in enumerate(plan['pages'])
+                   if all(self._satisfies(plan['xpaths'][index], visible) for index, visible in requirements)]
+        return {'matched': matched} if matched else {'matched': [], 'timeout': True}
+
+    def _satisfies(self, locator, visible):
+        element = self.elements.get(locator)
+        return element is not None and (visible is None or element.visible == visible)
+
+    def _read(self, locator):
+        element = self.elements.get(locator)
+        if element is None:
+            return {'existing': False}
+        return {'existing': True, 'value': element.value, 'text': element.text, 'visible': element.visible}
+
+    def _run_steps(self, steps, stop_on_error):
+        results = []
+        failed = False
+        for step in steps:
+            if failed and stop_on_error:
+                results.append(None)
+                continue
+            element = self.elements.get(step['locator'])
+            if element is None:
+                result = {'success': False, 'error': 'Element not found'}
+            elif step['op'] == 'click':
+                element.click()
+                result = {'success': True}
+            elif step['op'] == 'get-value':
+                result = {'success': True, 'value': element.value}
+            else:
+                element.value = step['value']
+                result = {'success': True}
+            result['elapsed_ms'] = 0.1
+            failed = failed or not result['success']
+            results.append(result)
+        return results
+
+class FakeRemoteDriver:
+    # webdriver.Remote of a Chrome session, DevTools only through execute()
+    def __init__(self, cdp_error=None):
+        self.command_executor = ChromiumRemoteConnection('http://grid:4444', 'goog', 'chrome')
+        self.cdp_error = cdp_error
+        self.commands = []
+
+    def execute(self, command, params):
+        self.commands.append((command, params))
+        if self.cdp_error:
+            raise self.cdp_error
+        return {'value': {'data': 'anBlZw=='}}
+
+    def get_screenshot_as_png(self):
+        self.commands.append(('screenshot', None))
+        return b'png'
+
+class BrowserActionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        application = Application(name='Test App')
+        db.session.add(application)
+        db.session.commit()
+        self.page = Page(
+            name='Login Page',
+            application_id=application.id,
+            identifying_selectors=[{'alias': 'form', 'xpath': '//form'}],
+            interactive_selectors=[
+                {'alias': 'user', 'xpath': '//input[@name="user"]'},
+                {'alias': 'password', 'xpath': '//input[@name="password"]'},
+                {'alias': 'login', 'xpath': '//button'}
+            ]
+        )
+        db.session.add(self.page)
+        db.session.commit()
+        self.driver = FakeDomDriver()
+        self.driver.add('//form')
+        self.driver.add('//input[@name="user"]', value='me')
+        self.driver.add('//input[@name="password"]')
+        self.driver.add('//button', text='Log in')
+        self.actions = BrowserActions(self.driver)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def step(self, action, alias=None, **kwargs):
+        return {'action': action, 'page_id': self.page.id, 'selector_alias': alias, **kwargs}
+
+    def scripts(self, method):
+        return [entry for entry in self.driver.log if entry == ('script', method)]
+
+    def test_batch_groups_steps_that_keep_the_page(self):
+        results = self.actions.run_batch([
+            self.step('get-value', 'user'),
+            self.step('set-value', 'password', value='secret', mode='direct'),
+            self.step('get-value', 'password'),
+            self.step('click', 'login'),
+            self.step('get-value', 'user'),
+        ])
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertEqual([result.get('batched', False) for result in results], [True, True, True, False, True])
+        self.assertEqual(results[2]['value'], 'secret')
+        # The click goes through WebDriver between the two script executions
+        self.assertEqual(len(self.scripts('runSteps')), 2)
+        self.assertEqual(self.driver.log.index(('click', '//button')), 1)
+
+    def test_batch_collapses_clicks_on_request(self):
+        results = self.actions.run_batch([
+            self.step('click', 'login'),
+            self.step('get-value', 'user'),
+        ], collapse_clicks=True)
+        self.assertEqual([result.get('batched') for result in results], [True, True])
+        self.assertEqual(self.driver.log, [('script', 'runSteps'), ('click', '//button')])
+
+        self.driver.log.clear()
+        results = self.actions.run_batch([self.step('get-value', 'user')], collapse=False)
+        self.assertEqual(results[0]['value'], 'me')
+        self.assertEqual(self.scripts('runSteps'), [])
+
+    def test_batch_stops_and_skips_after_an_error(self):
+        del self.driver.elements['//input[@name="password"]']
+        results = self.actions.run_batch([
+            self.step('get-value', 'user'),
+            self.step('get-value', 'password'),
+            self.step('get-value', 'user'),
+            self.step('click', 'login'),
+        ])
+        self.assertEqual([result['success'] for result in results], [True, False, False, False])
+        self.assertEqual(results[1]['error'], 'Element not found')
+        self.assertEqual([result.get('skipped', False) for result in results], [False, False, True, True])
+        self.assertNotIn(('click', '//button'), self.driver.log)
+
+        results = self.actions.run_batch([
+            self.step('get-value', 'missing'),
+            self.step('click', 'login'),
+        ])
+        self.assertEqual(results[0]['error'], 'Selector alias not found on page')
+        self.assertTrue(results[1]['skipped'])
+
+    def test_batch_reports_webdriver_errors_per_step(self):
+        self.driver.elements['//button'].error = ElementNotInteractableException('element not interactable\nStacktrace: ...')
+        results = self.actions.run_batch([
+            self.step('click', 'login'),
+            self.step('set-value', 'user', value='you'),
+        ], stop_on_error=False)
+        self.assertEqual(results[0], {'index': 0, 'action': 'click', 'success': False,
+                                      'error': 'element not interactable', 'elapsed_ms': results[0]['elapsed_ms']})
+        self.assertTrue(results[1]['success'])
+
+        results = self.actions.run_batch([self.step('click', 'login'), self.step('get-value', 'user')])
+        self.assertFalse(results[0]['success'])
+        self.assertTrue(results[1]['skipped'])
+
+        # The document went away under the script of a step group
+        self.driver.script_error = JavascriptException('javascript error: document unloaded')
+        results = self.actions.run_batch([
+            self.step('get-value', 'user'),
+            self.step('get-value', 'password'),
+        ], stop_on_error=False)
+        self.assertEqual([result['error'] for result in results], ['javascript error: document unloaded'] * 2)
+
+    def test_batch_continues_past_unknown_actions(self):
+        results = self.actions.run_batch([
+            self.step('hover', 'login'),
+            {'action': 'set-value', 'page_id': self.page.id, 'selector_alias': 'user'},
+            self.step('click', 'login'),
+            'not a step',
+        ], stop_on_error=False)
+        self.assertEqual([result['success'] for result in results], [False, False, True, False])
+        self.assertEqual(results[0]['error'], 'Unknown action: hover')
+        self.assertEqual(results[1]['error'], 'Missing value')
+        self.assertEqual(results[3]['error'], 'Unknown action: None')
+        self.assertFalse(any(result.get('skipped') for result in results))
+
+    def test_remote_screenshot_through_devtools(self):
+        driver = FakeRemoteDriver()
+        self.assertEqual(BrowserActions(driver).take_screenshot('jpeg', quality=50), (b'jpeg', None))
+        self.assertEqual(driver.commands, [('executeCdpCommand', {
+            'cmd': 'Page.captureScreenshot', 'params': {'format': 'jpeg', 'quality': 50}})])
+
+    def test_remote_screenshot_without_devtools_on_the_grid(self):
+        driver = FakeRemoteDriver(cdp_error=WebDriverException('unknown command: goog/cdp/execute'))
+        actions = BrowserActions(driver)
+        self.assertEqual(actions.take_screenshot('png'), (b'png', None))
+        # Refused once, plain WebDriver screenshots afterwards
+        self.assertEqual(actions.take_screenshot('png'), (b'png', None))
+        self.assertEqual([command for command, _ in driver.commands], ['executeCdpCommand', 'screenshot', 'screenshot'])
+
+class BrowserAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        factory = mock.patch.object(browser_manager.pool, 'factory', FakeDomDriver)
+        factory.start()
+        self.addCleanup(factory.stop)
+        self.session_id = browser_manager.create_session()
+        self.addCleanup(browser_manager.close_session, self.session_id)
+        self.driver = browser_manager.get_session(self.session_id)
+
+        self.shop = Application(name='Shop')
+        self.other = Application(name='Other')
+        db.session.add_all([self.shop, self.other])
+        db.session.commit()
+        self.login = self.add_page('Login', self.shop, '//form')
+        self.home = self.add_page('Home', self.shop, '//main')
+        self.other_page = self.add_page('Other Home', self.other, '//main')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_page(self, name, application, xpath, interactive=()):
+        page = Page(name=name, application_id=application.id,
+                    identifying_selectors=[{'alias': 'root', 'xpath': xpath}],
+                    interactive_selectors=list(interactive))
+        db.session.add(page)
+        db.session.commit()
+        return page
+
+    def post(self, path, data):
+        return self.client.post(f'/api/browser/{self.session_id}/{path}', data=json.dumps(data),
+                                content_type='application/json')
+
+    def test_wait_for_any_page_keeps_the_callers_order(self):
+        self.driver.add('//form')
+        self.driver.add('//main')
+        response = self.post('wait-for-any-page', {'page_ids': [str(self.home.id), self.login.id]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['page']['name'], 'Home')
+        response = self.post('wait-for-any-page', {'page_ids': [self.login.id, self.home.id], 'timeout': 0.5})
+        self.assertEqual(response.json['page']['name'], 'Login')
+
+    def test_wait_for_any_page_of_an_application(self):
+        self.driver.add('//main')
+        response = self.post('wait-for-any-page', {'application_id': self.other.id})
+        self.assertEqual(response.json['page']['name'], 'Other Home')
+        response = self.post('wait-for-any-page', {'application_id': str(self.shop.id)})
+        self.assertEqual(response.json['page']['name'], 'Home')
+
+    def test_wait_for_any_page_errors(self):
+        response = self.post('wait-for-any-page', {'page_ids': [self.login.id], 'timeout': 1})
+        self.assertEqual(response.status_code, 408)
+        self.assertIn('elapsed_ms', response.json)
+        for data in ({}, {'page_ids': [self.login.id], 'timeout': 'soon'}, {'page_ids': [self.login.id], 'timeout': 0},
+                     {'page_ids': ['one']}, {'page_ids': 3}, {'application_id': 'shop'}, {'page_ids': [999]}):
+            response = self.post('wait-for-any-page', data)
+            self.assertEqual(response.status_code, 400, data)
+
+    def test_wait_for_page_timeout(self):
+        self.driver.add('//form')
+        response = self.post('wait-for-page', {'page_id': self.login.id, 'timeout': '0.5'})
+        self.assertEqual(response.status_code, 204)
+        for timeout in ('soon', 0, -1, True, None, [10]):
+            response = self.post('wait-for-page', {'page_id': self.login.id, 'timeout': timeout})
+            self.assertEqual(response.status_code, 400, timeout)
+
+        response = self.post('batch', {'steps': [
+            {'action': 'wait-for-page', 'page_id': self.login.id, 'timeout': '10'},
+            {'action': 'wait-for-page', 'page_id': self.login.id, 'timeout': 'soon'},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        results = response.json['results']
+        self.assertTrue(results[0]['success'])
+        self.assertEqual(results[1]['error'], 'timeout must be a positive number of seconds')
+
+    def test_dom_since_the_current_revision(self):
+        url = f'/api/browser/{self.session_id}/dom'
+        tag = self.client.get(url).get_etag()[0]
+        response = self.client.get(f'{url}?since={tag}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'rev': tag, 'since': tag, 'edits': []})
+        response = self.client.get(f'{url}?since={tag}', headers={'If-None-Match': f'"{tag}"'})
+        self.assertEqual(response.status_code, 304)
+
+        self.driver.html = '<html><body><p>new</p></body></html>'
+        self.driver.dom_revision += 1
+        response = self.client.get(f'{url}?since={tag}')
+        self.assertEqual(response.json['edits'], [[12, 12, '<p>new</p>']])
+
+    def test_get_page_values(self):
+        page = self.add_page('Form', self.shop, '//form', [
+            {'alias': 'user', 'xpath': '//input[@name="user"]'},
+            {'alias': 'note', 'css': 'p.note'},
+            {'alias': 'gone', 'xpath': '//input[@name="gone"]'},
+            {'alias': 'nothing'}
+        ])
+        self.driver.add('//input[@name="user"]', value='me')
+        # Elements without a value property read as null
+        self.driver.add('css=p.note', value=None, text='Hello', visible=False)
+        response = self.client.get(f'/api/browser/{self.session_id}/page-values/{page.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'values': {
+            'user': {'value': 'me', 'text': '', 'visible': True},
+            'note': {'value': None, 'text': 'Hello', 'visible': False},
+            'gone': {'error': 'Element not found'}
+        }})
+        # One script execution for the whole page
+        self.assertEqual(self.driver.log, [('script', 'readValues')])
+        self.assertEqual(self.client.get(f'/api/browser/{self.session_id}/page-values/999').status_code, 404)
+
+    def test_set_page_values(self):
+        page = self.add_page('Form', self.shop, '//form', [
+            {'alias': 'user', 'xpath': '//input[@name="user"]'},
+            {'alias': 'password', 'xpath': '//input[@name="password"]'}
+        ])
+        self.driver.add('//input[@name="user"]', value='old')
+        self.driver.add('//input[@name="password"]')
+        response = self.post(f'page-values/{page.id}', {'values': {'user': 'me', 'password': 'secret', 'missing': 'x'}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'success': False, 'results': {
+            'user': {'success': True},
+            'password': {'success': True},
+            'missing': {'success': False, 'error': 'Selector alias not found on page'}
+        }})
+        self.assertEqual(self.driver.elements['//input[@name="user"]'].value, 'me')
+
+        response = self.post(f'page-values/{page.id}', {'values': {'user': 'you'}, 'mode': 'direct'})
+        self.assertTrue(response.json['success'])
+        self.assertEqual(self.driver.elements['//input[@name="user"]'].value, 'you')
+
+        for data in ({'values': {'user': None}}, {'values': {}}, {'values': ['me']},
+                     {'values': {'user': 'me'}, 'mode': 'paste'}):
+            self.assertEqual(self.post(f'page-values/{page.id}', data).status_code, 400, data)
+        self.assertEqual(self.post('page-values/999', {'values': {'user': 'me'}}).status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,355 @@
+import unittest
+import os
+import threading
+import tempfile
+import time
+import uuid
+from concurrent.futures import Future
+from unittest import mock
+from src.browser_manager import BrowserManager, SessionNotFoundError
+from src.driver_pool import DriverPool
+from src.session_executor import SessionExecutor, SessionBusyError, SessionClosedError
+from src.hub_scheduler import HubScheduler, NoCapacityError
+from src.session_registry import FileSessionRegistry, DatabaseSessionRegistry
+from src.element_cache import ElementCache
+from src.screencast import Screencast
+from src import create_app, db
+from src.config import Config
+
+class FakeExecutor:
+    def __init__(self, url='http://hub/wd/hub'):
+        self.timeout = None
+        self._url = url
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+class FakeDriver:
+    def __init__(self, healthy=True):
+        self.session_id = uuid.uuid4().hex
+        self.healthy = healthy
+        self.quit_called = False
+        self.command_executor = FakeExecutor()
+
+    @property
+    def current_url(self):
+        if not self.healthy:
+            raise RuntimeError('browser gone')
+        return 'about:blank'
+
+    def quit(self):
+        self.quit_called = True
+
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return predicate()
+
+class DriverPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.started = []
+
+        def factory():
+            driver = FakeDriver()
+            self.started.append(driver)
+            return driver
+
+        self.pool = DriverPool(factory, min_idle=2, max_idle=3, refill_interval=0.05)
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_disabled_pool_starts_driver_directly(self):
+        pool = DriverPool(FakeDriver)
+        self.assertIsInstance(pool.acquire(), FakeDriver)
+        self.assertEqual(pool.stats()['hits'], 0)
+        self.assertEqual(pool.stats()['misses'], 0)
+
+    def test_refills_to_min_and_counts_hits(self):
+        self.pool.start()
+        self.assertTrue(wait_until(lambda: self.pool.stats()['idle'] == 2))
+        driver = self.pool.acquire()
+        self.assertIn(driver, self.started)
+        self.assertEqual(self.pool.stats()['hits'], 1)
+        self.assertTrue(wait_until(lambda: self.pool.stats()['idle'] == 2))
+
+    def test_unhealthy_driver_is_discarded(self):
+        self.pool.start()
+        self.assertTrue(wait_until(lambda: self.pool.stats()['idle'] == 2))
+        for driver in self.started:
+            driver.healthy = False
+        driver = self.pool.acquire()
+        self.assertTrue(driver.healthy)
+        self.assertTrue(all(d.quit_called for d in self.started[:2]))
+        self.assertEqual(self.pool.stats()['misses'], 1)
+
+    def test_miss_raises_target_up_to_max(self):
+        self.pool.start()
+        for _ in range(5):
+            self.pool.acquire()
+        self.assertEqual(self.pool.stats()['target'], 3)
+
+class BrowserManagerPoolTestCase(unittest.TestCase):
+    def test_create_session_applies_timeout(self):
+        manager = BrowserManager(driver_factory=FakeDriver)
+        session_id = manager.create_session(timeout=30)
+        driver = manager.get_session(session_id)
+        self.assertEqual(driver.command_executor.timeout, 30)
+        manager.close_session(session_id)
+        self.assertTrue(driver.quit_called)
+        self.assertNotIn(session_id, manager.sessions)
+
+class BrowserManagerReaperTestCase(unittest.TestCase):
+    def test_idle_sessions_are_reaped(self):
+        manager = BrowserManager(driver_factory=FakeDriver, session_ttl=60)
+        stale_id = manager.create_session()
+        fresh_id = manager.create_session()
+        manager.last_used[stale_id] -= 120
+        stale_driver = manager.sessions[stale_id]
+        self.assertEqual(manager.reap_idle_sessions(), [stale_id])
+        self.assertTrue(stale_driver.quit_called)
+        self.assertIsNone(manager.get_session(stale_id))
+        self.assertIsNotNone(manager.get_session(fresh_id))
+
+    def test_least_recently_used_session_is_evicted(self):
+        manager = BrowserManager(driver_factory=FakeDriver, max_sessions=2)
+        first_id = manager.create_session()
+        second_id = manager.create_session()
+        first_driver = manager.get_session(first_id)
+        manager.create_session()
+        self.assertIn(first_id, manager.sessions)
+        self.assertNotIn(second_id, manager.sessions)
+        self.assertFalse(first_driver.quit_called)
+        self.assertEqual(len(manager.sessions), 2)
+
+    def test_busy_sessions_are_not_evicted(self):
+        manager = BrowserManager(driver_factory=FakeDriver, max_sessions=2)
+        first_id = manager.create_session()
+        second_id = manager.create_session()
+        release = threading.Event()
+        first = manager.submit(first_id, lambda driver: release.wait(2))
+        self.assertTrue(wait_until(lambda: manager.is_busy(first_id)))
+        third_id = manager.create_session()
+        self.assertIn(first_id, manager.sessions)
+        self.assertNotIn(second_id, manager.sessions)
+
+        third = manager.submit(third_id, lambda driver: release.wait(2))
+        self.assertTrue(wait_until(lambda: manager.is_busy(third_id)))
+        with self.assertRaises(NoCapacityError):
+            manager.create_session()
+        self.assertEqual(set(manager.sessions), {first_id, third_id})
+        release.set()
+        self.assertTrue(first.result(timeout=2) and third.result(timeout=2))
+
+class ElementCacheTestCase(unittest.TestCase):
+    def test_navigation_keeps_xpaths_and_drops_elements(self):
+        cache = ElementCache()
+        cache.put(1, 'login', '//button', element='element')
+        cache.clear_elements()
+        self.assertEqual(cache.get(1, 'login'), {'locator': '//button', 'element': None})
+
+    def test_page_edits_drop_entries(self):
+        cache = ElementCache()
+        cache.put(1, 'login', '//button', element='element')
+        cache.put(2, 'logout', '//a')
+        cache.forget_element('1', 'login')
+        cache.invalidate_page('1')
+        self.assertIsNone(cache.get(1, 'login'))
+        self.assertEqual(cache.stats()['entries'], 1)
+        self.assertEqual(cache.stats()['stale'], 1)
+
+    def test_sessions_get_their_own_cache(self):
+        manager = BrowserManager(driver_factory=FakeDriver)
+        first_id = manager.create_session()
+        second_id = manager.create_session()
+        manager.get_element_cache(first_id).put(1, 'login', '//button')
+        manager.get_element_cache(second_id).put(1, 'login', '//button')
+        manager.invalidate_page(1)
+        self.assertIsNone(manager.get_element_cache(second_id).get(1, 'login'))
+        manager.close_session(first_id)
+        self.assertIsNone(manager.get_element_cache(first_id))
+
+class ScreencastDriver(FakeDriver):
+    # Answers the selector engine's viewState and DevTools captures
+    def __init__(self):
+        super().__init__()
+        self.state = 'doc-1'
+        self.captures = []
+
+    def execute_script(self, script, method=None, args=None):
+        if method == 'pageRect':
+            return {'x': 0, 'y': 0, 'width': 800, 'height': 600}
+        return self.state if method == 'viewState' else None
+
+    def execute_cdp_cmd(self, command, params):
+        self.captures.append(params)
+        return {'data': 'ZnJhbWU='}
+
+class ScreencastTestCase(unittest.TestCase):
+    def next_frame(self, screencast):
+        frames = []
+        wait_until(lambda: frames.append(screencast.poll()) or frames[-1] is not None, timeout=1)
+        return frames[-1]
+
+    def test_frames_only_when_view_changes(self):
+        manager = BrowserManager(driver_factory=ScreencastDriver)
+        session_id = manager.create_session()
+        driver = manager.get_session(session_id)
+        with mock.patch('src.screencast.browser_manager', manager):
+            screencast = Screencast(session_id, fps=10, scale=0.5, quality=40)
+            frame = self.next_frame(screencast)
+            self.assertEqual((frame['format'], frame['data']), ('jpeg', 'ZnJhbWU='))
+            self.assertEqual(driver.captures[0]['quality'], 40)
+            self.assertEqual(driver.captures[0]['clip']['scale'], 0.5)
+            # Unchanged view state, no new frame until the keyframe interval passed
+            self.assertIsNone(self.next_frame(screencast))
+            driver.state = 'doc-2'
+            self.assertIsNotNone(self.next_frame(screencast))
+            self.assertEqual(len(driver.captures), 2)
+        manager.close_session(session_id)
+
+class SessionExecutorTestCase(unittest.TestCase):
+    def test_commands_run_in_order(self):
+        executor = SessionExecutor('test')
+        calls = []
+        futures = [executor.submit(calls.append, i) for i in range(10)]
+        for future in futures:
+            future.result(timeout=2)
+        self.assertEqual(calls, list(range(10)))
+        executor.shutdown()
+
+    def test_full_queue_raises_busy(self):
+        executor = SessionExecutor('test', max_queue=1)
+        release = threading.Event()
+        running = executor.submit(release.wait)
+        self.assertTrue(wait_until(lambda: executor._running == 1))
+        executor.submit(lambda: None)
+        with self.assertRaises(SessionBusyError):
+            executor.submit(lambda: None)
+        release.set()
+        running.result(timeout=2)
+        executor.shutdown()
+
+    def test_shutdown_while_submitting(self):
+        executor = SessionExecutor('test')
+
+        class ClosingFuture(Future):
+            # shutdown() wins the race right after submit() started
+            def __init__(self):
+                super().__init__()
+                executor.shutdown()
+
+        with mock.patch('src.session_executor.Future', ClosingFuture):
+            # Not queued behind the sentinel where nothing would ever run it
+            with self.assertRaises(SessionClosedError):
+                executor.submit(lambda: None)
+
+    def test_sessions_run_in_parallel(self):
+        manager = BrowserManager(driver_factory=FakeDriver)
+        first_id = manager.create_session()
+        second_id = manager.create_session()
+        release = threading.Event()
+        blocked = manager.executors[first_id].submit(release.wait)
+        # The second session is not held up by the blocked first one
+        driver = manager.execute(second_id, lambda driver: driver)
+        self.assertIs(driver, manager.sessions[second_id])
+        self.assertFalse(blocked.done())
+        release.set()
+        blocked.result(timeout=2)
+
+    def test_execute_unknown_session(self):
+        manager = BrowserManager(driver_factory=FakeDriver)
+        with self.assertRaises(SessionNotFoundError):
+            manager.execute('missing', lambda driver: None)
+
+class HubSchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.down = set()
+        self.connected = []
+
+        def connect(url):
+            if url in self.down:
+                raise ConnectionError(f'{url} is down')
+            self.connected.append(url)
+            return FakeDriver()
+
+        self.connect = connect
+        env = mock.patch.dict(os.environ, {'SELENIUM_MODE': 'remote'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def test_parse_endpoint_spec(self):
+        self.assertEqual(HubScheduler.parse('http://a/wd/hub|4, http://b/wd/hub'),
+                         [('http://a/wd/hub', 4), ('http://b/wd/hub', 0)])
+
+    def test_sessions_go_to_least_loaded_endpoint(self):
+        manager = BrowserManager(endpoints=[('http://a', 2), ('http://b', 4)], connect=self.connect)
+        for _ in range(3):
+            manager.create_session()
+        self.assertEqual(sorted(self.connected), ['http://a', 'http://b', 'http://b'])
+        stats = {e['url']: e for e in manager.endpoint_stats()}
+        self.assertEqual(stats['http://a']['active'], 1)
+        self.assertEqual(stats['http://b']['active'], 2)
+
+    def test_failed_endpoint_is_skipped(self):
+        self.down.add('http://a')
+        manager = BrowserManager(endpoints=[('http://a', 2), ('http://b', 2)], connect=self.connect)
+        manager.create_session()
+        manager.create_session()
+        self.assertEqual(self.connected, ['http://b', 'http://b'])
+        stats = {e['url']: e for e in manager.endpoint_stats()}
+        self.assertFalse(stats['http://a']['healthy'])
+        self.assertEqual(stats['http://a']['active'], 0)
+        with self.assertRaises(NoCapacityError):
+            manager.create_session()
+
+    def test_closing_session_frees_slot(self):
+        manager = BrowserManager(endpoints=[('http://a', 1)], connect=self.connect)
+        session_id = manager.create_session()
+        manager.close_session(session_id)
+        self.assertEqual(manager.endpoint_stats()[0]['active'], 0)
+        manager.create_session()
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+
+class SessionRegistryTestCase(unittest.TestCase):
+    def attach(self, executor_url, remote_session_id):
+        driver = FakeDriver()
+        driver.session_id = remote_session_id
+        driver.command_executor._url = executor_url
+        self.attached.append(driver)
+        return driver
+
+    def setUp(self):
+        self.attached = []
+
+    def check_reattach(self, registry):
+        owner = BrowserManager(driver_factory=FakeDriver, registry=registry)
+        other = BrowserManager(driver_factory=FakeDriver, registry=registry, attach=self.attach)
+        session_id = owner.create_session()
+        driver = other.execute(session_id, lambda driver: driver)
+        self.assertEqual(driver.session_id, owner.sessions[session_id].session_id)
+        self.assertEqual(driver.command_executor._url, 'http://hub/wd/hub')
+        other.close_session(session_id)
+        self.assertTrue(driver.quit_called)
+        self.assertIsNone(registry.lookup(session_id))
+        self.assertIsNone(BrowserManager(registry=registry).get_session(session_id))
+
+    def test_file_registry(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.check_reattach(FileSessionRegistry(os.path.join(tmp, 'sessions.json')))
+
+    def test_database_registry(self):
+        app = create_app(TestConfig)
+        with app.app_context():
+            db.create_all()
+            self.check_reattach(DatabaseSessionRegistry(app))
+            db.drop_all()
+
+if __name__ == '__main__':
+    unittest.main()
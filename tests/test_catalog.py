@@ -0,0 +1,180 @@
+import unittest
+import json
+from unittest import mock
+from sqlalchemy.exc import IntegrityError
+from src import create_app, db
+from src.models import Application, Page, CatalogChange, CatalogRevision
+from src.page_index import page_index
+from src.element_cache import ElementCache
+from src.browser_manager import browser_manager
+from src.config import Config
+from src.blueprints import catalog
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+
+class CatalogAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _import(self, records):
+        lines = [record if isinstance(record, str) else json.dumps(record) for record in records]
+        response = self.client.post('/api/catalog/import', data='\n'.join(lines) + '\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)
+
+    def test_export_and_import_round_trip(self):
+        app = Application(name='Shop')
+        db.session.add(app)
+        db.session.commit()
+        db.session.add(Page(name='Login', application_id=app.id, url='http://shop/login',
+                            identifying_selectors=[{'alias': 'form', 'xpath': '//form', 'css': 'form'}]))
+        db.session.commit()
+
+        response = self.client.get('/api/catalog/export')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        records = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(records[0], {'type': 'application', 'name': 'Shop'})
+        self.assertEqual(records[1]['application'], 'Shop')
+        self.assertEqual(records[1]['identifying_selectors'], [{'alias': 'form', 'xpath': '//form', 'css': 'form'}])
+
+        db.session.delete(app)
+        db.session.commit()
+        summary = self._import(records)
+        self.assertEqual(summary['applications']['created'], 1)
+        self.assertEqual(summary['pages']['created'], 1)
+        self.assertEqual(self.client.get('/api/catalog/export').data.decode().splitlines(),
+                         response.data.decode().splitlines())
+
+    def test_import_upserts_in_batches_and_reports_errors(self):
+        catalog.IMPORT_BATCH_SIZE = 2
+        self.addCleanup(setattr, catalog, 'IMPORT_BATCH_SIZE', 500)
+        summary = self._import([
+            {'type': 'application', 'name': 'Shop'},
+            {'type': 'page', 'application': 'Shop', 'name': 'Login', 'identifying_selectors': [{'alias': 'a', 'xpath': '//a'}]},
+            'not json',
+            {'type': 'page', 'application': 'Missing', 'name': 'Home'},
+            {'type': 'page', 'application': 'Shop', 'name': 'Login', 'url': 'http://shop/login'},
+            {'type': 'page', 'application': 'Shop', 'name': 'Cart', 'interactive_selectors': 'nope'},
+            {'type': 'application', 'name': 'Shop'},
+        ])
+        self.assertEqual(summary['applications'], {'created': 1, 'updated': 1})
+        self.assertEqual(summary['pages'], {'created': 1, 'updated': 1})
+        self.assertEqual([error['line'] for error in summary['errors']], [3, 4, 6])
+        self.assertEqual(summary['error_count'], 3)
+
+        page = Page.query.filter_by(name='Login').one()
+        self.assertEqual(page.url, 'http://shop/login')
+        # Fields missing from the line keep their value
+        self.assertEqual(page.identifying_selectors, [{'alias': 'a', 'xpath': '//a'}])
+
+    def test_bad_line_does_not_lose_its_batch(self):
+        pages = [{'type': 'page', 'application': 'Shop', 'name': f'Page {i}'} for i in range(6)]
+        pages[2]['can_be_navigated_to'] = 'yes'
+        pages[3]['identifying_selectors'] = [{'alias': 'a', 'xpath': {'nested': True}}]
+        pages[4]['name'] = 'Broken'
+        upsert = catalog._Import._upsert_page
+
+        def refuse_broken(import_, record, application_id, existing):
+            # Fails after the page was flushed, the savepoint has to take it back
+            result = upsert(import_, record, application_id, existing)
+            if record['name'] == 'Broken':
+                raise IntegrityError('INSERT INTO page ...', {}, Exception('NOT NULL constraint failed: page.x'))
+            return result
+
+        with mock.patch.object(catalog._Import, '_upsert_page', refuse_broken):
+            summary = self._import([{'type': 'application', 'name': 'Shop'}] + pages)
+        self.assertEqual(summary['applications']['created'], 1)
+        self.assertEqual(summary['pages']['created'], 3)
+        self.assertEqual(summary['errors'], [
+            {'line': 4, 'error': 'can_be_navigated_to must be true or false'},
+            {'line': 5, 'error': 'identifying_selectors values must be strings or booleans'},
+            {'line': 6, 'error': 'Not saved: NOT NULL constraint failed: page.x'},
+        ])
+        self.assertEqual(sorted(page.name for page in Page.query.all()), ['Page 0', 'Page 1', 'Page 5'])
+
+    def test_failed_commit_rolls_back_whole_batch(self):
+        records = [{'type': 'application', 'name': 'Shop'}, {'type': 'page', 'application': 'Shop', 'name': 'Login'}]
+        commit = mock.Mock(side_effect=IntegrityError('COMMIT', {}, Exception('database is locked')))
+        with mock.patch.object(db.session, 'commit', commit):
+            summary = self._import(records)
+        self.assertEqual(summary['errors'], [{'line': 1, 'error': 'Batch rolled back: database is locked'},
+                                             {'line': 2, 'error': 'Batch rolled back: database is locked'}])
+        # The released savepoints were part of the batch transaction
+        self.assertEqual(Application.query.count(), 0)
+        self.assertEqual(Page.query.count(), 0)
+
+    def test_revision_header_and_changes_feed(self):
+        response = self.client.get('/api/applications')
+        self.assertEqual(response.headers['X-Catalog-Revision'], '0')
+
+        response = self.client.post('/api/applications', data=json.dumps({'name': 'Shop'}),
+                                    content_type='application/json')
+        self.assertEqual(response.headers['X-Catalog-Revision'], '1')
+        app_id = json.loads(response.data)['id']
+        response = self.client.post('/api/pages', data=json.dumps({
+            'name': 'Login', 'application_id': app_id, 'identifying_selectors': []
+        }), content_type='application/json')
+        page_id = json.loads(response.data)['id']
+        response = self.client.delete(f'/api/applications/{app_id}')
+        self.assertEqual(response.headers['X-Catalog-Revision'], '4')
+
+        data = json.loads(self.client.get('/api/catalog/changes?since=1').data)
+        self.assertEqual(data['revision'], 4)
+        self.assertFalse(data['more'])
+        self.assertEqual([(c['entity'], c['id'], c['action']) for c in data['changes']], [
+            ('page', page_id, 'created'), ('application', app_id, 'deleted'), ('page', page_id, 'deleted')])
+        self.assertEqual(json.loads(self.client.get('/api/catalog/changes?since=4').data)['changes'], [])
+        self.assertEqual(self.client.get('/api/catalog/changes?since=x').status_code, 400)
+
+    def test_revisions_come_from_the_counter(self):
+        # Changes recorded before the counter row existed are continued
+        db.session.add(CatalogChange(id=7, entity='application', entity_id=1, action='deleted'))
+        db.session.commit()
+        for name in ('One', 'Two'):
+            response = self.client.post('/api/applications', data=json.dumps({'name': name}),
+                                        content_type='application/json')
+        self.assertEqual(response.headers['X-Catalog-Revision'], '9')
+        self.assertEqual(db.session.get(CatalogRevision, 1).revision, 9)
+        self.assertEqual([change.id for change in CatalogChange.since(0)], [7, 8, 9])
+
+    def test_writes_of_other_workers_invalidate_caches(self):
+        app = Application(name='Shop')
+        db.session.add(app)
+        db.session.commit()
+        page = Page(name='Login', application_id=app.id, identifying_selectors=[{'alias': 'a', 'xpath': '//a'}])
+        db.session.add(page)
+        db.session.commit()
+        self.client.get('/api/applications')
+
+        page_index.revision_interval = 0
+        self.addCleanup(setattr, page_index, 'revision_interval', 1.0)
+        page_index.invalidate()
+        self.assertEqual(len(page_index.get().pages), 1)
+        cache = ElementCache()
+        cache.put(page.id, 'a', '//a')
+        browser_manager.element_caches['s'] = cache
+        self.addCleanup(browser_manager.element_caches.pop, 's', None)
+
+        # Another worker deletes the page, only the database knows
+        db.session.delete(page)
+        CatalogChange.record('page', page.id, 'deleted')
+        db.session.commit()
+
+        self.assertEqual(page_index.get().pages, [])
+        self.client.get('/api/applications')
+        self.assertIsNone(cache.get(page.id, 'a'))
+
+if __name__ == '__main__':
+    unittest.main()
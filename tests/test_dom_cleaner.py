@@ -0,0 +1,29 @@
+import unittest
+from src.dom_cleaner import clean_dom, iter_clean_dom
+
+HTML = (
+    '<!DOCTYPE html><html><head><title>Shop &amp; more</title><style>p { color: red; }</style>'
+    '<link rel="stylesheet" href="x.css"><script>if (a < b) { alert("<b>"); }</script></head>'
+    '<body><div id="main">Hello <b>there</b><img src="logo.png"><br/>'
+    '<svg viewBox="0 0 1 1"><g><svg><path d="M0"/></svg></g></svg><input value="1"></div></body></html>'
+)
+
+class DomCleanerTestCase(unittest.TestCase):
+    def test_removes_tags_and_empties_svg(self):
+        self.assertEqual(
+            clean_dom(HTML),
+            '<!DOCTYPE html><html><head><title>Shop &amp; more</title></head>'
+            '<body><div id="main">Hello <b>there</b><br/><svg viewBox="0 0 1 1"></svg><input value="1"></div></body></html>'
+        )
+
+    def test_output_does_not_depend_on_chunking(self):
+        self.assertEqual(''.join(iter_clean_dom(HTML, chunk_size=7)), clean_dom(HTML))
+
+    def test_pretty(self):
+        lines = clean_dom(HTML, pretty=True).splitlines()
+        self.assertIn('  <title>', lines)
+        self.assertIn('   Shop &amp; more', lines)
+        self.assertEqual(lines[-1], '</html>')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import time
+import unittest
+from src.dom_snapshots import DomSnapshots, diff, apply_diff
+
+OLD = '<html><body><div id="a">One</div><ul><li>1</li><li>2</li></ul></body></html>'
+NEW = '<html><body><div id="a" class="x">Two</div><ul><li>1</li></ul><p>new</p></body></html>'
+
+class DomSnapshotsTestCase(unittest.TestCase):
+    def test_diff_round_trip(self):
+        edits = diff(OLD, NEW)
+        self.assertEqual(apply_diff(OLD, edits), NEW)
+        self.assertEqual(diff(OLD, OLD), [])
+        # Unchanged tags are not repeated in the edits
+        self.assertNotIn('<ul>', ''.join(text for _, _, text in edits))
+
+    def test_large_repetitive_dom(self):
+        rows = ''.join(f'<tr><td>{i % 3}</td><td>x</td></tr>' for i in range(50000))
+        old = f'<html><body><table>{rows}</table></body></html>'
+        one_cell = old.replace('<td>x</td></tr>', '<td>y</td></tr>', 1)
+        start = time.monotonic()
+        edits = diff(old, one_cell)
+        self.assertEqual(apply_diff(old, edits), one_cell)
+        self.assertEqual(len(edits), 1)
+        # Changes spread over the whole table are not diffed
+        spread = one_cell[:-100] + one_cell[-100:].replace('<td>x</td>', '<td>z</td>')
+        self.assertIsNone(diff(old, spread))
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_only_latest_snapshots_are_kept(self):
+        snapshots = DomSnapshots(limit=2)
+        for rev in ('a-1', 'a-2', 'a-3'):
+            snapshots.put(rev, rev)
+        self.assertIsNone(snapshots.get('a-1'))
+        self.assertEqual(snapshots.get('a-3'), 'a-3')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import json
+from src import create_app, db
+from src.models import Application, Page
+from src.config import Config
+from src.page_index import PageIndex, page_index
+from src.locators import to_by
+from selenium.webdriver.common.by import By
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+
+TEST_PAGES = [
+    {
+        'id': 1,
+        'identifying_selectors': [
+            {'alias': 'header', 'xpath': '//header'},
+            {'alias': 'login', 'xpath': '//form[@id="login"]', 'visible': 'True'}
+        ]
+    },
+    {
+        'id': 2,
+        'identifying_selectors': [
+            {'alias': 'header', 'xpath': '//header'},
+            {'alias': 'error', 'xpath': '//div[@class="error"]', 'visible': True}
+        ]
+    },
+    {'id': 3, 'identifying_selectors': []},
+    {'id': 4, 'identifying_selectors': [{'alias': 'broken'}]}
+]
+
+class PageIndexTestCase(unittest.TestCase):
+    def test_shared_selectors_come_first(self):
+        index = PageIndex(TEST_PAGES)
+        self.assertEqual([page['id'] for page in index.pages], [1, 2])
+        self.assertEqual(index.xpaths[0], '//header')
+        self.assertEqual(index.dependents['//header'], [0, 1])
+        self.assertEqual(index.requirements[0], [(0, None), (2, True)])
+
+    def test_match(self):
+        index = PageIndex(TEST_PAGES)
+        results = {
+            '//header': {'existing': True, 'visible': True},
+            '//form[@id="login"]': {'existing': True, 'visible': True},
+            '//div[@class="error"]': {'existing': True, 'visible': False}
+        }
+        self.assertEqual([page['id'] for page in index.match(results)], [1])
+        self.assertEqual(index.match({}), [])
+
+    def test_fastest_locator_is_used(self):
+        index = PageIndex([{'id': 5, 'identifying_selectors': [
+            {'alias': 'form', 'xpath': '//form', 'css': 'form.login'},
+            {'alias': 'user', 'xpath': '//input[@id="user"]', 'css': 'input#user', 'id': 'user'},
+            {'alias': 'logo', 'css': 'img.logo'}
+        ]}])
+        self.assertEqual(sorted(index.xpaths), ['css=form.login', 'css=img.logo', 'id=user'])
+        self.assertEqual(to_by('id=user'), (By.ID, 'user'))
+        self.assertEqual(to_by('css=img.logo'), (By.CSS_SELECTOR, 'img.logo'))
+        self.assertEqual(to_by('//form'), (By.XPATH, '//form'))
+
+    def test_plan_is_json_serializable(self):
+        plan = json.loads(json.dumps(PageIndex(TEST_PAGES).plan()))
+        self.assertEqual(plan['pages'][1], [[0, None], [1, True]])
+
+    def test_key_follows_plan_content(self):
+        # Workers building the same index agree on the key, other plans never share it
+        self.assertEqual(PageIndex(TEST_PAGES).key, PageIndex(list(TEST_PAGES)).key)
+        self.assertNotEqual(PageIndex(TEST_PAGES).key, PageIndex(TEST_PAGES[:1]).key)
+        self.assertNotEqual(PageIndex(TEST_PAGES).key, PageIndex(TEST_PAGES[1::-1]).key)
+
+class PageIndexCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.app_instance = Application(name='Test App')
+        db.session.add(self.app_instance)
+        db.session.commit()
+        page_index.invalidate()
+
+    def tearDown(self):
+        page_index.invalidate()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_index_is_rebuilt_after_page_changes(self):
+        self.assertEqual(page_index.get().pages, [])
+        self.assertIs(page_index.get(), page_index.get())
+        response = self.client.post('/api/pages', data=json.dumps({
+            'name': 'Home Page',
+            'application_id': self.app_instance.id,
+            'identifying_selectors': [{'alias': 'logo', 'xpath': '//img[@alt="logo"]'}]
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([page['name'] for page in page_index.get().pages], ['Home Page'])
+
+        self.client.delete(f'/api/applications/{self.app_instance.id}')
+        self.assertEqual(page_index.get().pages, [])
+
+if __name__ == '__main__':
+    unittest.main()
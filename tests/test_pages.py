@@ -1,8 +1,10 @@
 import unittest
 import json
+import gzip
 from src import create_app, db
-from src.models import Application, Page
+from src.models import Application, Page, Selector, CatalogChange
 from src.config import Config
+from src.browser_actions import BrowserActions
 
 class TestConfig(Config):
     TESTING = True
@@ -59,6 +61,64 @@ class PageAPITestCase(unittest.TestCase):
         self.assertEqual(len(data), 1)
         self.assertEqual(data[0]['name'], 'Home Page')
 
+    def test_get_pages_conditional_and_compressed(self):
+        for i in range(20):
+            db.session.add(Page(
+                name=f'Page {i}',
+                application_id=self.app_instance.id,
+                identifying_selectors=[{'alias': 'logo', 'xpath': '//img[@alt="logo"]'}]
+            ))
+        db.session.commit()
+
+        response = self.client.get('/api/pages', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))), 20)
+
+        etag = response.headers['ETag']
+        response = self.client.get('/api/pages', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        page = Page.query.first()
+        self.client.put(f'/api/pages/{page.id}', data=json.dumps({'name': 'Renamed'}), content_type='application/json')
+        response = self.client.get('/api/pages', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_pages_paginated_projected_and_filtered(self):
+        other = Application(name='Other App')
+        db.session.add(other)
+        db.session.commit()
+        for i in range(5):
+            db.session.add(Page(name=f'Login {i}', application_id=self.app_instance.id,
+                                identifying_selectors=[{'alias': 'form', 'xpath': '//form'}]))
+        db.session.add(Page(name='Login_other', application_id=other.id, identifying_selectors=[]))
+        db.session.commit()
+
+        names = []
+        url = '/api/pages?limit=2&fields=id,name&name_prefix=Login%20'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.data)
+            self.assertTrue(all(set(page) == {'id', 'name'} for page in data))
+            names += [page['name'] for page in data]
+            url = response.headers.get('Link', '<>')[1:].split('>')[0] or None
+        self.assertEqual(names, [f'Login {i}' for i in range(5)])
+
+        response = self.client.get('/api/pages?limit=2&cursor=0')
+        self.assertIn('X-Next-Cursor', response.headers)
+        self.assertIn('identifying_selectors', json.loads(response.data)[0])
+
+        response = self.client.get(f'/api/pages?application_id={other.id}&fields=name')
+        self.assertEqual(json.loads(response.data), [{'name': 'Login_other'}])
+        response = self.client.get(f'/api/applications/{other.id}/pages?name_prefix=Login_')
+        self.assertEqual([page['name'] for page in json.loads(response.data)], ['Login_other'])
+
+        self.assertEqual(self.client.get('/api/pages?fields=password').status_code, 400)
+        self.assertEqual(self.client.get('/api/pages?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/applications?cursor=x').status_code, 400)
+        self.assertEqual(self.client.get('/api/applications/999/pages').status_code, 404)
+
     def test_get_page(self):
         # Test getting a single page
         page = Page(
@@ -106,5 +166,77 @@ class PageAPITestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 204)
         self.assertIsNone(Page.query.get(page.id))
 
+    def test_selectors_are_stored_as_rows(self):
+        page = Page(
+            name='Login Page',
+            application_id=self.app_instance.id,
+            identifying_selectors=[{'alias': 'form', 'xpath': '//form', 'visible': 'true'}],
+            interactive_selectors=[{'alias': 'user', 'xpath': '//input[@name="user"]', 'id': 'user', 'note': 'x'}]
+        )
+        other = Page(
+            name='Other Page',
+            application_id=self.app_instance.id,
+            identifying_selectors=[{'alias': 'main', 'xpath': '//main'}]
+        )
+        db.session.add_all([page, other])
+        db.session.commit()
+
+        self.assertEqual(Selector.query.count(), 3)
+        self.assertEqual(page.to_dict()['identifying_selectors'], [{'alias': 'form', 'xpath': '//form', 'visible': True}])
+        self.assertEqual(page.to_dict()['interactive_selectors'],
+                         [{'alias': 'user', 'xpath': '//input[@name="user"]', 'id': 'user', 'note': 'x'}])
+        self.assertEqual(Selector.find(page.id, 'user').element_id, 'user')
+
+        response = self.client.get('/api/pages?xpath=//form')
+        self.assertEqual([p['name'] for p in json.loads(response.data)], ['Login Page'])
+
+        # Updates without selector keys keep the rows
+        self.client.put(f'/api/pages/{page.id}', data=json.dumps({'name': 'Login'}), content_type='application/json')
+        self.assertEqual(Selector.query.filter_by(page_id=page.id).count(), 2)
+
+        self.client.delete(f'/api/pages/{page.id}')
+        self.assertEqual(Selector.query.count(), 1)
+
+    def test_legacy_selectors_are_read_until_moved(self):
+        page = Page(name='Legacy Page', application_id=self.app_instance.id)
+        page.legacy_identifying_selectors = [{'alias': 'logo', 'xpath': '//img'}]
+        page.legacy_interactive_selectors = [{'alias': 'go', 'xpath': '//button'}]
+        db.session.add(page)
+        db.session.commit()
+
+        data = json.loads(self.client.get(f'/api/pages/{page.id}').data)
+        self.assertEqual(data['identifying_selectors'], [{'alias': 'logo', 'xpath': '//img'}])
+        self.assertEqual(BrowserActions(None)._resolve_selector(page.id, 'go'), ('//button', None))
+
+        # Editing one list moves both into rows
+        self.client.put(f'/api/pages/{page.id}', data=json.dumps({'interactive_selectors': [{'alias': 'stop', 'xpath': '//a'}]}),
+                        content_type='application/json')
+        page = db.session.get(Page, page.id)
+        self.assertIsNone(page.legacy_identifying_selectors)
+        self.assertEqual(Selector.find(page.id, 'logo').xpath, '//img')
+        self.assertEqual(page.interactive_selectors, [{'alias': 'stop', 'xpath': '//a'}])
+
+    def test_backfill_legacy_selectors(self):
+        page = Page(name='Legacy Page', application_id=self.app_instance.id)
+        page.legacy_identifying_selectors = [{'alias': 'logo', 'xpath': '//img'}]
+        page.legacy_interactive_selectors = [{'alias': 'go', 'xpath': '//button', 'css': 'button'}]
+        db.session.add(page)
+        db.session.commit()
+
+        result = self.app.test_cli_runner().invoke(args=['selectors', 'backfill'])
+        self.assertIn('Moved the selectors of 1 page(s)', result.output)
+        page = db.session.get(Page, page.id)
+        self.assertEqual(page.identifying_selectors, [{'alias': 'logo', 'xpath': '//img'}])
+        self.assertEqual(page.interactive_selectors, [{'alias': 'go', 'xpath': '//button', 'css': 'button'}])
+        self.assertIsNone(page.legacy_identifying_selectors)
+        # Cleared to SQL NULL, so later runs find nothing to move
+        cleared = db.session.execute(db.text(
+            'SELECT COUNT(*) FROM page WHERE identifying_selectors IS NULL AND interactive_selectors IS NULL')).scalar()
+        self.assertEqual(cleared, 1)
+        changes = CatalogChange.query.count()
+        result = self.app.test_cli_runner().invoke(args=['selectors', 'backfill'])
+        self.assertIn('Moved the selectors of 0 page(s)', result.output)
+        self.assertEqual(CatalogChange.query.count(), changes)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
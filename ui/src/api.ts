@@ -112,5 +112,5 @@ export const api = {
     fetch(`/api/browser/${sessionId}/dom`).then(r => r.text()),
 
   getCleanedDom: (sessionId: string) =>
-    fetch(`/api/browser/${sessionId}/cleaned-dom`).then(r => r.text()),
+    fetch(`/api/browser/${sessionId}/cleaned-dom?pretty=true`).then(r => r.text()),
 };
\ No newline at end of file
@@ -1,6 +1,8 @@
 export interface Selector {
   alias: string;
   xpath: string;
+  css?: string; // Optional faster locators, preferred over xpath
+  id?: string;
   visible: boolean | null; // Tristate
 }
 